@@ -0,0 +1,101 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Reports the import time of the entry point and of the pipeline, from python -X importtime.
+
+Usage: python -m benchmarks.import_time [-n 15] [-o report.json]
+"""
+
+# IMPORT: utils
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# CONSTANTS: the modules the CLI must not load before its arguments are valid
+HEAVY_MODULES = ("torch", "monai", "torchio", "SimpleITK", "pydicom", "matplotlib", "nrrd", "onnxruntime", "nibabel")
+
+# CONSTANTS: the measured commands, run from the project's root
+COMMANDS = {
+    "cli_help": ["main.py", "--help"],
+    "cli_bad_argument": ["main.py", "--precision", "fp64"],
+    "pipeline": ["-c", "import src; src.PredictionManagement"]
+}
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses shell's arguments.
+
+    Returns:
+        - (argparse.Namespace): the object containing all arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-n", "--top", type=int, nargs="?",
+                        default=15, help="number of slowest top-level imports printed per command.")
+
+    parser.add_argument("-o", "--output", type=str, nargs="?",
+                        default=None, help="JSON report's path.")
+
+    return parser.parse_args()
+
+
+def measure(command: list) -> dict:
+    """
+    Runs a command with -X importtime and parses its report.
+
+    Parameters:
+        - command (list): the python arguments.
+
+    Returns:
+        - (dict): the command's return code, the total import time and every top-level import's cumulative
+          time in seconds, and the heavy modules it loaded.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *command], cwd=ROOT_PATH, capture_output=True, text=True
+    )
+
+    # Lines are "import time: self [us] | cumulative | imported package", nesting is the name's indent
+    imports, loaded = dict(), set()
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip())
+        if not name[1:].startswith(" "):
+            imports[name.strip()] = int(cumulative) / 1e6
+
+    return {
+        "returncode": process.returncode,
+        "total": sum(imports.values()),
+        "imports": dict(sorted(imports.items(), key=lambda item: item[1], reverse=True)),
+        "heavy_modules": [module for module in HEAVY_MODULES if module in loaded]
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = {name: measure(command) for name, command in COMMANDS.items()}
+
+    for name, measures in report.items():
+        print(f"\n{name}: {round(measures['total'], 3)} secondes d'import")
+        for module, seconds in list(measures["imports"].items())[:args.top]:
+            print(f"    {module:<40}{seconds:>10.3f}")
+
+    if args.output is not None:
+        with open(args.output, "w") as report_file:
+            json.dump(report, report_file, indent=4)
+
+    # The CLI must answer --help and reject bad arguments without loading the pipeline
+    regressions = [name for name in ["cli_help", "cli_bad_argument"] if report[name]["heavy_modules"]]
+    for name in regressions:
+        print(f"\n{name} importe des modules lourds: {', '.join(report[name]['heavy_modules'])}")
+
+    sys.exit(1 if regressions else 0)
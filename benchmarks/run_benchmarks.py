@@ -0,0 +1,212 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Times the inference stages on synthetic series and compares them with a stored baseline.
+
+Usage: python -m benchmarks.run_benchmarks [-t dicom nrrd] [-d 64 128] [-ub]
+"""
+
+# IMPORT: utils
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+
+# IMPORT: deep learning
+import torch
+
+# IMPORT: projet
+from src import PredictionManagement
+from benchmarks.synthetic import generate_dicom_series, generate_nrrd_volume
+
+# WARNINGS SHUT DOWN
+import warnings
+warnings.filterwarnings("ignore")
+
+# CONSTANTS: one baseline per host, timings are not comparable between machines
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+
+def parse_args() -> argparse.Namespace:
+    """
+    Parses shell's arguments.
+
+    Returns:
+        - (argparse.Namespace): the object containing all arguments.
+    """
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument("-t", "--file_types", type=str, nargs="+",
+                        choices=["dicom", "nrrd"], default=["dicom", "nrrd"], help="synthetic series' file types.")
+
+    parser.add_argument("-d", "--depths", type=int, nargs="+",
+                        default=[64], help="synthetic series' numbers of slices.")
+
+    parser.add_argument("-sp", "--spacings", type=str, nargs="+",
+                        default=["2,1.5234375,1.5234375", "3.27,2.734375,2.734375"],
+                        help="synthetic series' spacings, as z,x,y.")
+
+    parser.add_argument("-m", "--matrix", type=int, nargs="?",
+                        default=512, help="synthetic series' in-plane size.")
+
+    parser.add_argument("-sd", "--seed", type=int, nargs="?",
+                        default=0, help="synthetic series' random seed.")
+
+    parser.add_argument("-r", "--repeats", type=int, nargs="?",
+                        default=3, help="number of timed runs per case, the median is kept.")
+
+    parser.add_argument("-wu", "--warmup", type=int, nargs="?",
+                        default=1, help="number of untimed runs per case.")
+
+    parser.add_argument("-wp", "--weights_path", type=str, nargs="?",
+                        default=None, help="model weights, a randomly initialized model if not set.")
+
+    parser.add_argument("-p", "--precision", type=str, nargs="?",
+                        choices=["fp32", "bf16", "int8"], default="fp32", help="inference precision.")
+
+    parser.add_argument("-s", "--streaming", action="store_true",
+                        help="benchmark the streaming inference.")
+
+    parser.add_argument("-zc", "--zero_copy", action="store_true",
+                        help="benchmark the zero-copy mode.")
+
+    parser.add_argument("-b", "--baseline", type=str, nargs="?",
+                        default=os.path.join(BASELINES_PATH, f"{socket.gethostname()}.json"),
+                        help="baseline's path.")
+
+    parser.add_argument("-ub", "--update_baseline", action="store_true",
+                        help="store this run as the baseline.")
+
+    parser.add_argument("-tol", "--tolerance", type=float, nargs="?",
+                        default=0.1, help="relative slowdown reported as a regression.")
+
+    return parser.parse_args()
+
+
+def run_case(predictor: PredictionManagement, file_path: str, file_type: str, repeats: int, warmup: int) -> dict:
+    """
+    Times every stage and the whole run of a series.
+
+    Parameters:
+        - predictor (PredictionManagement): the predictor, its model stays loaded between cases.
+        - file_path (str): the series' path.
+        - file_type (str): the series' file type.
+        - repeats (int): the number of timed runs, the median is kept.
+        - warmup (int): the number of untimed runs.
+
+    Returns:
+        - (dict): the stages' and the whole run's median timings, in seconds.
+    """
+    runs = list()
+    for run_idx in range(warmup + repeats):
+        predictor.set_input(file_path, file_type)
+
+        start = time.perf_counter()
+        result = predictor.launch()
+        predictor.wait_saves()
+        end_to_end = time.perf_counter() - start
+
+        if run_idx >= warmup:
+            runs.append({**result["timings"], "end_to_end": end_to_end})
+
+    return {stage: statistics.median(run[stage] for run in runs) for stage in runs[0]}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Prints the timings next to the baseline's ones.
+
+    Parameters:
+        - results (dict): this run's timings, indexed by case and stage.
+        - baseline (dict): the baseline's timings, indexed by case and stage.
+        - tolerance (float): the relative slowdown reported as a regression.
+
+    Returns:
+        - (list): the regressed (case, stage) pairs.
+    """
+    regressions = list()
+    print(f"\n{'cas':<36}{'étape':<18}{'référence':>10}{'actuel':>10}{'ratio':>8}")
+
+    for case, stages in results.items():
+        for stage, seconds in stages.items():
+            reference = baseline.get(case, dict()).get(stage)
+            if reference is None:
+                print(f"{case:<36}{stage:<18}{'-':>10}{seconds:>10.3f}{'-':>8}")
+                continue
+
+            ratio = seconds / max(reference, 1e-9)
+            if ratio > 1 + tolerance:
+                regressions.append((case, stage))
+            print(f"{case:<36}{stage:<18}{reference:>10.3f}{seconds:>10.3f}{ratio:>7.2f}x")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    config = {
+        "rescale_intensity": True, "clip_value": 0, "crop_value": 0,
+        "weights_path": args.weights_path, "precision": args.precision, "streaming": args.streaming,
+        "zero_copy": args.zero_copy
+    }
+
+    # Timings measured with another precision or mode are not comparable, checked before running anything
+    baseline = None
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["params"] != config:
+            raise ValueError(
+                f"The baseline was measured with other parameters: {baseline['params']}; run with them, "
+                f"choose another baseline with -b or replace it with -ub."
+            )
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmp_path:
+        # The synthetic series' indexes are removed with them, the index directory is not part of the configuration
+        params = {**config, "dicom_index_path": os.path.join(tmp_path, "dicom_index")}
+        predictor = PredictionManagement(file_path=None, file_type="dicom", params=params)
+        try:
+            for file_type in args.file_types:
+                for depth in args.depths:
+                    for spacing in args.spacings:
+                        spacing = tuple(float(value) for value in spacing.split(","))
+                        case = f"{file_type}_d{depth}_m{args.matrix}_z{spacing[0]}_xy{spacing[1]}"
+                        case_path = os.path.join(tmp_path, case)
+
+                        print(f"\nGénération de {case}")
+                        if file_type == "dicom":
+                            file_path = generate_dicom_series(
+                                os.path.join(case_path, "dicom"), depth, spacing, args.matrix, args.seed
+                            )
+                        else:
+                            file_path = generate_nrrd_volume(
+                                os.path.join(case_path, "volume.nrrd"), depth, spacing, args.matrix, args.seed
+                            )
+
+                        results[case] = run_case(predictor, file_path, file_type, args.repeats, args.warmup)
+        finally:
+            predictor.close()
+
+    report = {
+        "host": socket.gethostname(), "torch": torch.__version__, "num_threads": torch.get_num_threads(),
+        "params": config, "cases": results
+    }
+
+    regressions = list()
+    if baseline is not None:
+        regressions = compare(results, baseline["cases"], args.tolerance)
+        print(f"\n{len(regressions)} régression(s) au-delà de {round(args.tolerance * 100)}%.")
+    else:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(report, baseline_file, indent=4)
+        print(f"\nRéférence enregistrée: {args.baseline}")
+
+    sys.exit(1 if regressions else 0)
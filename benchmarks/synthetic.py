@@ -0,0 +1,142 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Generates reproducible synthetic PET series, as DICOM directories or NRRD volumes.
+"""
+
+# IMPORT: utils
+import os
+
+# IMPORT: data loading
+import nrrd
+from pydicom.dataset import Dataset, FileDataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+# IMPORT: data processing
+import numpy as np
+
+# CONSTANTS: PET Image Storage
+PET_SOP_CLASS_UID = "1.2.840.10008.5.1.4.1.1.128"
+
+
+def generate_phantom(depth: int, matrix: int, seed: int = 0) -> np.ndarray:
+    """
+    Generates a noisy PET-like phantom: a body cylinder with a few hot spheres.
+
+    Parameters:
+        - depth (int): the number of slices.
+        - matrix (int): the in-plane size.
+        - seed (int): the random generator's seed.
+
+    Returns:
+        - (np.ndarray): the phantom's activity, (z, x, y) float32.
+    """
+    rng = np.random.default_rng(seed)
+    z, x, y = np.meshgrid(
+        np.linspace(-1, 1, depth), np.linspace(-1, 1, matrix), np.linspace(-1, 1, matrix),
+        indexing="ij", sparse=True
+    )
+
+    # Body
+    activity = np.broadcast_to(np.where((x / 0.8) ** 2 + (y / 0.6) ** 2 <= 1, 1000., 0.), (depth, matrix, matrix))
+
+    # Lesions
+    for _ in range(5):
+        center = rng.uniform(-0.5, 0.5, size=3)
+        radius = rng.uniform(0.05, 0.15)
+        lesion = (z - center[0]) ** 2 + (x - center[1]) ** 2 + (y - center[2]) ** 2 <= radius ** 2
+        activity = np.where(lesion, activity + rng.uniform(2000., 8000.), activity)
+
+    return rng.poisson(activity).astype(np.float32)
+
+
+def generate_dicom_series(output_path: str, depth: int, spacing: tuple, matrix: int = 512,
+                          seed: int = 0, position: str = "HFS") -> str:
+    """
+    Writes a synthetic PET series, one dicom file per slice with its own rescale slope.
+
+    Parameters:
+        - output_path (str): the dicom directory's path.
+        - depth (int): the number of slices.
+        - spacing (tuple): the series' spacing, (z, x, y).
+        - matrix (int): the in-plane size.
+        - seed (int): the random generator's seed.
+        - position (str): the patient position.
+
+    Returns:
+        - (str): the dicom directory's path.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    volume = generate_phantom(depth, matrix, seed)
+
+    # The UIDs derive from the seed so a series is generated identically every time
+    study_uid = generate_uid(entropy_srcs=[f"study-{seed}"])
+    series_uid = generate_uid(entropy_srcs=[f"series-{seed}-{depth}-{spacing}-{matrix}"])
+    for slice_idx, pixels in enumerate(volume):
+        # Stored as uint16, the slope brings the values back to the activity
+        slope = max(float(pixels.max()), 1.) / 65535
+        stored = np.round(pixels / slope).astype(np.uint16)
+
+        file_meta = FileMetaDataset()
+        file_meta.MediaStorageSOPClassUID = PET_SOP_CLASS_UID
+        file_meta.MediaStorageSOPInstanceUID = generate_uid(entropy_srcs=[series_uid, str(slice_idx)])
+        file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        file_path = os.path.join(output_path, f"{slice_idx:04d}.dcm")
+        dicom_file = FileDataset(file_path, Dataset(), file_meta=file_meta, preamble=b"\0" * 128)
+        dicom_file.is_little_endian = True
+        dicom_file.is_implicit_VR = False
+
+        dicom_file.SOPClassUID = PET_SOP_CLASS_UID
+        dicom_file.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+        dicom_file.StudyInstanceUID = study_uid
+        dicom_file.SeriesInstanceUID = series_uid
+        dicom_file.Modality = "PT"
+        dicom_file.PatientPosition = position
+        dicom_file.InstanceNumber = slice_idx + 1
+
+        dicom_file.ImagePositionPatient = [0., 0., round(slice_idx * spacing[0], 3)]
+        dicom_file.SliceThickness = spacing[0]
+        dicom_file.PixelSpacing = [spacing[1], spacing[2]]
+        dicom_file.RescaleSlope = round(slope, 8)
+        dicom_file.RescaleIntercept = 0
+
+        dicom_file.Rows, dicom_file.Columns = stored.shape
+        dicom_file.SamplesPerPixel = 1
+        dicom_file.PhotometricInterpretation = "MONOCHROME2"
+        dicom_file.BitsAllocated = 16
+        dicom_file.BitsStored = 16
+        dicom_file.HighBit = 15
+        dicom_file.PixelRepresentation = 0
+        dicom_file.PixelData = stored.tobytes()
+
+        dicom_file.save_as(file_path, write_like_original=False)
+
+    return output_path
+
+
+def generate_nrrd_volume(output_path: str, depth: int, spacing: tuple, matrix: int = 512, seed: int = 0) -> str:
+    """
+    Writes a synthetic PET volume, stored in the axis order expected by NRRDLoader.
+
+    Parameters:
+        - output_path (str): the nrrd file's path.
+        - depth (int): the number of slices.
+        - spacing (tuple): the volume's spacing, (z, x, y).
+        - matrix (int): the in-plane size.
+        - seed (int): the random generator's seed.
+
+    Returns:
+        - (str): the nrrd file's path.
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    volume = generate_phantom(depth, matrix, seed)
+
+    # Inverse of NRRDLoader._adjust_axis
+    volume = np.rot90(volume, k=-1, axes=(0, 2))
+    header = {"space directions": np.diag([spacing[1], spacing[2], spacing[0]])}
+    nrrd.write(output_path, np.ascontiguousarray(volume), header)
+
+    return output_path
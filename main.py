@@ -7,16 +7,23 @@ Purpose: Manages the project.
 """
 
 # IMPORT: utils
+import os
+import sys
 import time
+import json
 import argparse
+import contextlib
 
-# IMPORT: projet
-from src import PredictionManagement
+# IMPORT: projet, the loaders' registry only reads files' first bytes
+from src.loading.loader_registry import get_file_types, detect_file_type
 
 # WARNINGS SHUT DOWN
 import warnings
 warnings.filterwarnings("ignore")
 
+# ARGUMENTS: the inference arguments, at most four of them can be set at once
+INFERENCE_ARGS = ["file", "file_type", "rescale_intensity", "clip_value", "crop_value"]
+
 
 def parse_args() -> argparse.Namespace:
     """
@@ -31,7 +38,8 @@ def parse_args() -> argparse.Namespace:
                         default="None", help="file path.")
 
     parser.add_argument("-t", "--file_type", type=str, nargs="?",
-                        choices=["dicom", "nrrd"], default="dicom", help="file type.")
+                        choices=[*get_file_types(), "auto"], default="auto",
+                        help="file type, detected from the file's content if auto.")
 
     parser.add_argument("-ri", "--rescale_intensity", type=bool, nargs="?",
                         default=False, help="rescale intensity to its input range.")
@@ -42,17 +50,218 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("-cr", "--crop_value", type=int, nargs="?",
                         default=0, help="crop z-axis volume according to crop value.")
 
+    parser.add_argument("-w", "--num_workers", type=int, nargs="?",
+                        default=1, help="number of workers reading and decoding dicom files.")
+
+    parser.add_argument("-we", "--loading_executor", type=str, nargs="?",
+                        choices=["thread", "process"], default="thread", help="dicom loading workers' pool.")
+
+    parser.add_argument("-su", "--series_uid", type=str, nargs="?",
+                        default=None, help="SeriesInstanceUID of the series to load, when a directory holds several.")
+
+    parser.add_argument("-mo", "--modality", type=str, nargs="?",
+                        default=None, help="Modality of the series to load, when a directory holds several.")
+
+    parser.add_argument("-di", "--dicom_index_path", type=str, nargs="?",
+                        default=None, help="directory of the dicom headers' indexes, resources/dicom_index if not set.")
+
+    parser.add_argument("-p", "--precision", type=str, nargs="?",
+                        choices=["fp32", "bf16", "int8"], default="fp32",
+                        help="inference precision, int8 quantizes the Linear layers dynamically (CPU only).")
+
+    parser.add_argument("-be", "--backend", type=str, nargs="?",
+                        choices=["torch", "onnx"], default="torch",
+                        help="inference backend, onnx falls back to torch if its export is missing or stale.")
+
+    parser.add_argument("-eo", "--export_onnx", action="store_true",
+                        help="export the model to ONNX next to its weights, then exit.")
+
+    parser.add_argument("-er", "--engine_report", action="store_true",
+                        help="compare the precision's error and speed against fp32 on the file, then exit.")
+
+    parser.add_argument("-chl", "--channels_last", action="store_true",
+                        help="use channels_last memory format on CPU.")
+
+    parser.add_argument("-tol", "--tolerance", type=float, nargs="?",
+                        default=0., help="max absolute error tolerated against fp32, checked if > 0.")
+
+    parser.add_argument("-ml", "--model_loading", type=str, nargs="?",
+                        choices=["eager", "mmap", "torchscript"], default="eager",
+                        help="load the weights eagerly, memory-mapped or through a cached TorchScript artifact.")
+
+    parser.add_argument("-dpw", "--data_parallel", type=int, nargs="?",
+                        default=1, help="number of processes sharing the inference, each one pinned to its cores.")
+
+    parser.add_argument("-st", "--skip_threshold", type=float, nargs="?",
+                        default=None, help="skip the patches whose intensity stays below this threshold.")
+
+    parser.add_argument("-sv", "--skip_value", type=float, nargs="?",
+                        default=0., help="predicted value of the skipped patches.")
+
+    parser.add_argument("-s", "--streaming", action="store_true",
+                        help="predict slab by slab while the slices are read, bounds the input memory.")
+
+    parser.add_argument("-ti", "--tiling", action="store_true",
+                        help="predict overlapping in-plane tiles instead of cropping the planes to 512x512.")
+
+    parser.add_argument("-ts", "--tile_size", type=int, nargs="?",
+                        default=512, help="in-plane size of the tiles, a multiple of 32.")
+
+    parser.add_argument("-to", "--tile_overlap", type=float, nargs="?",
+                        default=0.25, help="fraction of a tile shared with its neighbours.")
+
+    parser.add_argument("-zc", "--zero_copy", action="store_true",
+                        help="share the volume's buffers between stages instead of copying them where possible.")
+
+    parser.add_argument("-o", "--output_format", type=str, nargs="?",
+                        choices=["pt", "npy", "npz", "nrrd"], default="pt",
+                        help="output format, npz is zstd compressed and npy can be memory-mapped.")
+
+    parser.add_argument("-hf", "--half", action="store_true",
+                        help="store the predicted noise as float16.")
+
+    parser.add_argument("-bs", "--background_save", action="store_true",
+                        help="write the predicted noise in a background thread.")
+
+    parser.add_argument("-c", "--cache", action="store_true",
+                        help="reuse the results of series already predicted with the same parameters and weights.")
+
+    parser.add_argument("-cs", "--cache_size", type=int, nargs="?",
+                        default=10240, help="maximum size of the result cache, in MB.")
+
+    parser.add_argument("-j", "--jobs", type=str, nargs="?",
+                        default=None, help="JSONL file of studies to predict with overlapping stages.")
+
+    parser.add_argument("-qs", "--queue_size", type=int, nargs="?",
+                        default=1, help="number of studies waiting between two pipeline stages.")
+
+    parser.add_argument("-at", "--autotune", action="store_true",
+                        help="calibrate the batch size and the number of threads on this host.")
+
+    parser.add_argument("-mb", "--memory_budget", type=int, nargs="?",
+                        default=4096, help="memory budget of the calibration, in MB.")
+
+    parser.add_argument("-d", "--daemon", type=str, nargs="?",
+                        choices=["stdin", "socket", "spool"], default=None,
+                        help="keep the model resident and read studies from a JSONL stdin, a Unix socket or a spool.")
+
+    parser.add_argument("-dp", "--daemon_path", type=str, nargs="?",
+                        default=None, help="the daemon's Unix socket or spool directory path.")
+
+    parser.add_argument("-mp", "--metrics_path", type=str, nargs="?",
+                        default=None, help="metrics report written after each run, JSON if .json else Prometheus text.")
+
+    parser.add_argument("-tr", "--trace_path", type=str, nargs="?",
+                        default=None, help="torch.profiler chrome trace written after each run.")
+
     return parser.parse_args()
 
 
+def check_input(file_path: str, file_type: str):
+    """
+    Verifies the input matches its file type, before the pipeline's dependencies are loaded.
+
+    Parameters:
+        - file_path (str): the input file path.
+        - file_type (str): the input file type, detected from the file's content if "auto".
+
+    Returns:
+        - (str): the input file type.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"No such file or directory: {file_path}.")
+    if file_type == "auto":
+        file_type = detect_file_type(file_path)
+    if file_type == "dicom" and not os.path.isdir(file_path):
+        raise ValueError(f"A dicom input must be a directory: {file_path}.")
+    if file_type != "dicom" and not os.path.isfile(file_path):
+        raise ValueError(f"A {file_type} input must be a file: {file_path}.")
+    return file_type
+
+
 if __name__ == "__main__":
     args = parse_args()
-    if args.file == "None" or len([arg for arg in args._get_kwargs() if arg[1]]) > 4:
+    single_study = args.daemon is None and args.jobs is None and not (args.autotune or args.export_onnx)
+    if single_study and (args.file == "None" or len([arg for arg in INFERENCE_ARGS if getattr(args, arg)]) > 4):
         raise ValueError(f"Wrong arguments, use -help to have more information.")
+    if args.daemon in ["socket", "spool"] and args.daemon_path is None:
+        raise ValueError(f"The {args.daemon} daemon needs a path, use -help to have more information.")
+    if single_study or args.engine_report:
+        args.file_type = check_input(args.file, args.file_type)
+    if args.jobs is not None and not os.path.isfile(args.jobs):
+        raise FileNotFoundError(f"No such jobs file: {args.jobs}.")
+
+    # IMPORT: projet, torch and the backends are only loaded once the arguments are valid
+    import src
+
+    params = {
+        "rescale_intensity": args.rescale_intensity, "clip_value": args.clip_value, "crop_value": args.crop_value,
+        "num_workers": args.num_workers, "loading_executor": args.loading_executor,
+        "series_uid": args.series_uid, "modality": args.modality, "dicom_index_path": args.dicom_index_path,
+        "precision": args.precision, "channels_last": args.channels_last, "tolerance": args.tolerance,
+        "model_loading": args.model_loading, "streaming": args.streaming, "zero_copy": args.zero_copy,
+        "tiling": args.tiling, "tile_size": args.tile_size, "tile_overlap": args.tile_overlap,
+        "data_parallel": args.data_parallel, "backend": args.backend,
+        "skip_threshold": args.skip_threshold, "skip_value": args.skip_value,
+        "cache": args.cache, "cache_size": args.cache_size * 2 ** 20,
+        "output_format": args.output_format, "half": args.half, "background_save": args.background_save,
+        "metrics_path": args.metrics_path, "trace_path": args.trace_path
+    }
+
+    # Every runner is closed at the end, its background saves are flushed and its workers stopped
+    if args.export_onnx:
+        predictor = src.PredictionManagement(file_path=None, file_type=args.file_type, params=params)
+        try:
+            print(f"Export ONNX: {predictor.export_onnx()}")
+        finally:
+            predictor.close()
+    elif args.engine_report:
+        # Progress messages go to stderr, stdout only holds the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            predictor = src.PredictionManagement(file_path=args.file, file_type=args.file_type, params=params)
+            try:
+                report = predictor.report_engine()
+            finally:
+                predictor.close()
+        print(json.dumps(report, indent=4))
+    elif args.autotune:
+        predictor = src.PredictionManagement(file_path=None, file_type=args.file_type, params=params)
+        try:
+            tuning = predictor.autotune(memory_budget=args.memory_budget * 2 ** 20)
+            print(f"Taille de batch: {tuning['batch_size']}, threads: {tuning['num_threads']}.")
+        finally:
+            predictor.close()
+    elif args.daemon is not None:
+        daemon = src.PredictionDaemon(params=params)
+        try:
+            if args.daemon == "stdin":
+                daemon.serve_stdin()
+            elif args.daemon == "socket":
+                daemon.serve_socket(args.daemon_path)
+            else:
+                daemon.serve_spool(args.daemon_path)
+        finally:
+            daemon.close()
+    elif args.jobs is not None:
+        with open(args.jobs) as jobs_file:
+            jobs = [json.loads(line) for line in jobs_file if line.strip()]
 
-    params = {"rescale_intensity": args.rescale_intensity, "clip_value": args.clip_value, "crop_value": args.crop_value}
-    predictor = PredictionManagement(file_path=args.file, file_type=args.file_type, params=params)
+        # Progress messages go to stderr, stdout only holds the JSON results
+        with contextlib.redirect_stdout(sys.stderr):
+            runner = src.PipelineRunner(params=params, queue_size=args.queue_size)
+            try:
+                results = runner.launch(jobs)
+            finally:
+                runner.close()
+        for result in results:
+            print(json.dumps(result))
+    else:
+        predictor = src.PredictionManagement(file_path=args.file, file_type=args.file_type, params=params)
 
-    start = time.time()
-    predictor.launch()
-    print(f"Temps total de segmentation: {round(time.time() - start, 3)} secondes.")
+        start = time.time()
+        try:
+            predictor.launch()
+            predictor.wait_saves()
+        finally:
+            predictor.close()
+        print(f"Temps total de segmentation: {round(time.time() - start, 3)} secondes.")
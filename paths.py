@@ -24,3 +24,18 @@ MODELS
 """
 MODELS_PATH = os.path.join(RESOURCES_PATH, "models")
 MODEL_PATH = os.path.join(MODELS_PATH, "model.pt")
+
+"""
+AUTOTUNING
+"""
+AUTOTUNE_PATH = os.path.join(RESOURCES_PATH, "autotune")
+
+"""
+CACHE
+"""
+CACHE_PATH = os.path.join(RESOURCES_PATH, "cache")
+
+"""
+DICOM INDEX
+"""
+DICOM_INDEX_PATH = os.path.join(RESOURCES_PATH, "dicom_index")
@@ -1 +1,7 @@
-from .prediction import PredictionManagement
+from .lazy_exports import lazy_exports
+
+__all__, __getattr__, __dir__ = lazy_exports(__name__, {
+    "PredictionManagement": ".prediction",
+    "PredictionDaemon": ".daemon",
+    "PipelineRunner": ".pipeline"
+})
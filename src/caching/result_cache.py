@@ -0,0 +1,145 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Stores the predicted volumes on disk, keyed by series, parameters and model weights.
+"""
+
+# IMPORT: utils
+import os
+import json
+import shutil
+import hashlib
+import contextlib
+
+# IMPORT: project
+import utils
+
+
+class ResultCache:
+    _KEY_PARAMS = (
+        "rescale_intensity", "clip_value", "crop_value", "precision", "backend", "skip_threshold", "skip_value",
+        "output_format", "half", "tiling", "tile_size", "tile_overlap"
+    )
+
+    def __init__(self, cache_path: str, weights_path: str, max_size: int):
+        """
+        Initializes an instance of ResultCache class.
+
+        Parameters:
+            - cache_path (str): the cache directory's path.
+            - weights_path (str): the model weights' path, part of every key.
+            - max_size (int): the maximum size of the cache, in bytes.
+        """
+        if weights_path is None:
+            raise ValueError("The result cache needs the model weights' path.")
+
+        self._cache_path = cache_path
+        self._max_size = max_size
+        os.makedirs(self._cache_path, exist_ok=True)
+
+        self._weights_hash = self._get_weights_hash(weights_path)
+
+    def get_key(self, identity: str, params: dict) -> str:
+        """
+        Returns the key of a result.
+
+        Parameters:
+            - identity (str): the series' identity, see FileLoader.get_identity.
+            - params (dict): the inference parameters.
+
+        Returns:
+            - (str): the result's key.
+        """
+        key = {
+            "identity": identity,
+            "weights": self._weights_hash,
+            "params": {param: params.get(param) for param in self._KEY_PARAMS}
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def fetch(self, key: str, output_path: str) -> bool:
+        """
+        Copies a cached result to the output path.
+
+        Parameters:
+            - key (str): the result's key.
+            - output_path (str): the output path.
+
+        Returns:
+            - (bool): True if the result was cached else False.
+        """
+        entry_path = os.path.join(self._cache_path, key)
+        try:
+            # The modification time drives the LRU eviction
+            os.utime(entry_path)
+            shutil.copyfile(entry_path, output_path)
+        except FileNotFoundError:
+            return False
+
+        return True
+
+    def store(self, key: str, output_path: str):
+        """
+        Stores a result, then evicts the least recently used ones if the cache is too large.
+
+        Parameters:
+            - key (str): the result's key.
+            - output_path (str): the result's path.
+        """
+        entry_path = os.path.join(self._cache_path, key)
+
+        # Written under a temporary name so concurrent processes never fetch a partial entry
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, entry_path)
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used results until the cache fits into its maximum size.
+        """
+        # Other processes share the cache, an entry may be removed at any time
+        entries = list()
+        for entry in os.scandir(self._cache_path):
+            if len(entry.name) == 64 and "." not in entry.name:
+                with contextlib.suppress(FileNotFoundError):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self._max_size:
+                break
+
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry_path)
+            total_size -= size
+
+    def _get_weights_hash(self, weights_path: str) -> str:
+        """
+        Returns the model weights' hash, recomputed only if the weights changed.
+
+        Parameters:
+            - weights_path (str): the model weights' path.
+
+        Returns:
+            - (str): the model weights' sha256 hex digest.
+        """
+        stat = os.stat(weights_path)
+        signature = {"path": os.path.abspath(weights_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+        signature_path = os.path.join(self._cache_path, "weights.json")
+        if os.path.exists(signature_path):
+            with open(signature_path) as signature_file:
+                stored = json.load(signature_file)
+            if stored["signature"] == signature:
+                return stored["sha256"]
+
+        weights_hash = utils.hash_files([weights_path])
+        with open(signature_path, "w") as signature_file:
+            json.dump({"signature": signature, "sha256": weights_hash}, signature_file)
+
+        return weights_hash
@@ -0,0 +1,151 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Keeps the model resident and predicts the studies received from a local queue.
+"""
+
+# IMPORT: utils
+import os
+import sys
+import json
+import time
+import socket
+import contextlib
+
+# IMPORT: projet
+from .prediction import PredictionManagement
+
+
+class PredictionDaemon:
+    def __init__(self, params: dict):
+        """
+        Initializes an instance of PredictionDaemon class.
+
+        Parameters:
+            - params (dict): the inference parameters.
+        """
+        self._predictor = PredictionManagement(file_path=None, file_type="auto", params=params)
+
+    def process(self, job: dict) -> dict:
+        """
+        Predicts a study.
+
+        Parameters:
+            - job (dict): the study to predict, {"file": path, "file_type": "auto" | "dicom" | "nrrd" | ...};
+              the file type is detected from the file's content if missing.
+
+        Returns:
+            - (dict): the job's result, its output path and its timings.
+        """
+        start = time.time()
+        if not isinstance(job, dict) or "file" not in job:
+            return {"file": None, "status": "error", "error": f"A job must be an object with a file: {job!r}."}
+
+        try:
+            # Progress messages must not be mixed with the results' stream
+            with contextlib.redirect_stdout(sys.stderr):
+                self._predictor.set_input(job["file"], job.get("file_type", "auto"))
+                result = {"status": "done", **self._predictor.launch()}
+                self._predictor.wait_saves()
+        except Exception as error:
+            result = {"status": "error", "error": repr(error)}
+
+        return {"file": job["file"], **result, "total": time.time() - start}
+
+    def process_line(self, line: str) -> dict:
+        """
+        Predicts a study received as a JSON line, a malformed line gets an error result.
+
+        Parameters:
+            - line (str | bytes): the JSON encoded job.
+
+        Returns:
+            - (dict): the job's result, its output path and its timings.
+        """
+        try:
+            job = json.loads(line)
+        except ValueError as error:
+            return {"file": None, "status": "error", "error": f"Malformed job: {error}."}
+
+        return self.process(job)
+
+    def close(self):
+        """
+        Waits for the background saves and stops the predictor's workers.
+        """
+        self._predictor.close()
+
+    def serve_stdin(self, stdin=sys.stdin, stdout=sys.stdout):
+        """
+        Predicts the studies read as JSON lines until the end of stdin, writes the results as JSON lines.
+
+        Parameters:
+            - stdin (io.TextIOBase): the jobs' stream.
+            - stdout (io.TextIOBase): the results' stream.
+        """
+        for line in stdin:
+            if not line.strip():
+                continue
+
+            stdout.write(json.dumps(self.process_line(line)) + "\n")
+            stdout.flush()
+
+    def serve_socket(self, socket_path: str):
+        """
+        Predicts the studies received as JSON lines on a Unix socket, answers on the same connection.
+
+        Parameters:
+            - socket_path (str): the Unix socket's path.
+        """
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(socket_path)
+            server.listen()
+
+            while True:
+                connection, _ = server.accept()
+                try:
+                    with connection, connection.makefile("rw") as stream:
+                        self.serve_stdin(stdin=stream, stdout=stream)
+                except (OSError, UnicodeDecodeError) as error:
+                    # A client leaving or sending garbage only ends its own connection
+                    print(f"Connexion interrompue: {error!r}", file=sys.stderr)
+
+    def serve_spool(self, spool_path: str, poll_interval: float = 1.):
+        """
+        Predicts the studies dropped as JSON files in a spool directory.
+
+        Jobs are moved to spool_path/processing while running and their results written to spool_path/done.
+
+        Parameters:
+            - spool_path (str): the spool directory's path.
+            - poll_interval (float): the delay between two directory scans, in seconds.
+        """
+        processing_path = os.path.join(spool_path, "processing")
+        done_path = os.path.join(spool_path, "done")
+        os.makedirs(processing_path, exist_ok=True)
+        os.makedirs(done_path, exist_ok=True)
+
+        while True:
+            jobs = sorted(f for f in os.listdir(spool_path) if f.endswith(".json"))
+            if not jobs:
+                time.sleep(poll_interval)
+                continue
+
+            for job_name in jobs:
+                job_path = os.path.join(processing_path, job_name)
+                try:
+                    os.replace(os.path.join(spool_path, job_name), job_path)
+                    with open(job_path, "rb") as job_file:
+                        result = self.process_line(job_file.read())
+
+                    with open(os.path.join(done_path, job_name), "w") as result_file:
+                        json.dump(result, result_file)
+                    os.remove(job_path)
+                except OSError as error:
+                    # A job removed or unreadable meanwhile is skipped, the next ones are still served
+                    print(f"Job {job_name} ignoré: {error!r}", file=sys.stderr)
@@ -0,0 +1,230 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Maps volumes to the model grid and back in a single interpolation pass.
+"""
+
+# IMPORT: utils
+import math
+
+# IMPORT: tensor
+import torch
+import torch.nn.functional as F
+
+# IMPORT: project
+import utils
+
+
+class GeometryEngine:
+    # The number of sampled voxels per slab, bounds the sampling grid to 48 MB
+    _GRID_SIZE = 2 ** 22
+
+    def __init__(self, default_spacing: tuple = (2., 1.5234375, 1.5234375), desired_shape: int = 512,
+                 min_shape: int = 0):
+        """
+        Initializes an instance of GeometryEngine class.
+
+        Parameters:
+            - default_spacing (tuple): the model grid's spacing.
+            - desired_shape (int): the model grid's in-plane size, the resampled size is kept if None.
+            - min_shape (int): the in-plane size the resampled planes are padded to, when desired_shape is None.
+        """
+        self._default_spacing = default_spacing
+        self._desired_shape = desired_shape
+        self._min_shape = min_shape
+
+    def to_model_grid(self, volume: torch.Tensor, input_spacing: tuple, shared: bool = False) -> torch.Tensor:
+        """
+        Resamples a volume to the model's spacing and crops or pads it in-plane to the model's size.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to map, (1, z, x, y).
+            - input_spacing (tuple): the volume's spacing.
+            - shared (bool): whether the mapped volume is written in shared memory, for the data parallel workers.
+
+        Returns:
+            - (torch.Tensor): the volume on the model grid.
+        """
+        target_shape = (
+            self.get_resampled_size(volume.shape[1], input_spacing[0], self._default_spacing[0]),
+            *self.get_plane_shape(volume.shape[2:], input_spacing)
+        )
+        return self._transform(volume, input_spacing, self._default_spacing, target_shape, shared)
+
+    def from_model_grid(self, volume: torch.Tensor, output_spacing: tuple, output_shape: tuple) -> torch.Tensor:
+        """
+        Resamples a volume from the model's spacing and crops or pads it to the original shape.
+
+        Parameters:
+            - volume (torch.Tensor): the volume on the model grid, (1, z, x, y).
+            - output_spacing (tuple): the original spacing.
+            - output_shape (tuple): the original shape.
+
+        Returns:
+            - (torch.Tensor): the volume on the original grid.
+        """
+        return self._transform(volume, self._default_spacing, output_spacing, tuple(output_shape))
+
+    def transform_plane(self, pixels: torch.Tensor, input_spacing: tuple) -> torch.Tensor:
+        """
+        Resamples and crops or pads a single slice to the model grid.
+
+        Parameters:
+            - pixels (torch.Tensor): the slice to map, (x, y).
+            - input_spacing (tuple): the volume's spacing.
+
+        Returns:
+            - (torch.Tensor): the slice on the model grid.
+        """
+        spacing = (self._default_spacing[0], *input_spacing[1:])
+        target_shape = (1, *self.get_plane_shape(pixels.shape, input_spacing))
+        return self._transform(pixels[None, None], spacing, self._default_spacing, target_shape)[0, 0]
+
+    def get_plane_shape(self, plane_shape: tuple, input_spacing: tuple) -> tuple:
+        """
+        Returns the in-plane shape on the model grid.
+
+        Parameters:
+            - plane_shape (tuple): the input in-plane shape, (x, y).
+            - input_spacing (tuple): the volume's spacing.
+
+        Returns:
+            - (tuple): the model grid's in-plane shape.
+        """
+        if self._desired_shape is not None:
+            return self._desired_shape, self._desired_shape
+
+        return tuple(
+            max(self.get_resampled_size(size, input_spacing[axis], self._default_spacing[axis]), self._min_shape)
+            for axis, size in zip((1, 2), plane_shape)
+        )
+
+    @staticmethod
+    def get_resampled_size(size: int, input_spacing: float, output_spacing: float) -> int:
+        """
+        Returns an axis' size after resampling.
+
+        Parameters:
+            - size (int): the axis' size.
+            - input_spacing (float): the axis' spacing.
+            - output_spacing (float): the desired spacing.
+
+        Returns:
+            - (int): the resampled axis' size.
+        """
+        if input_spacing == output_spacing:
+            return size
+        return max(1, round(size * input_spacing / output_spacing))
+
+    def _transform(self, volume: torch.Tensor, input_spacing: tuple, output_spacing: tuple,
+                   target_shape: tuple, shared: bool = False) -> torch.Tensor:
+        """
+        Resamples and crops or pads every axis in a single trilinear pass, a volume needing no resampling is only
+        cropped or padded.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to map, (1, z, x, y).
+            - input_spacing (tuple): the volume's spacing.
+            - output_spacing (tuple): the desired spacing.
+            - target_shape (tuple): the desired shape.
+            - shared (bool): whether the mapped volume is allocated in shared memory.
+
+        Returns:
+            - (torch.Tensor): the mapped volume.
+        """
+        volume = volume[0]
+
+        # EXACT SPACING: crop or pad only
+        if all(input_spacing[axis] == output_spacing[axis] for axis in range(3)):
+            if tuple(volume.shape) == tuple(target_shape) and (volume.is_shared() or not shared):
+                return volume[None]
+            return self._crop_or_pad(volume, dict(enumerate(target_shape)), shared)[None]
+
+        # RESAMPLE, CROP AND PAD: the crop or pad is folded into the sampled positions
+        positions, outsides = zip(*[
+            self._get_positions(volume.shape[axis], input_spacing[axis], output_spacing[axis], target_shape[axis])
+            for axis in range(3)
+        ])
+        positions = [position.to(volume.dtype) for position in positions]
+
+        # The sampling grid is built slab by slab so its size stays bounded, the output is the only full volume
+        output = utils.allocate_tensor(tuple(target_shape), shared=shared).to(volume.dtype)
+        slab_size = max(1, self._GRID_SIZE // (target_shape[1] * target_shape[2]))
+        for start in range(0, target_shape[0], slab_size):
+            z_positions = positions[0][start: start + slab_size]
+
+            # grid_sample's last grid axis is (y, x, z)
+            grid = torch.stack(torch.broadcast_tensors(
+                positions[2][None, None, :], positions[1][None, :, None], z_positions[:, None, None]
+            ), dim=-1)
+            output[start: start + len(z_positions)] = F.grid_sample(
+                volume[None, None], grid[None], mode="bilinear", padding_mode="border", align_corners=True
+            )[0, 0]
+
+        for axis, outside in enumerate(outsides):
+            output.index_fill_(axis, outside, 0)
+
+        utils.count_volume_copy("resample")
+        return output[None]
+
+    @staticmethod
+    def _crop_or_pad(volume: torch.Tensor, target_sizes: dict, shared: bool = False) -> torch.Tensor:
+        """
+        Centers the volume into the target sizes, as tio.CropOrPad does.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to crop or pad.
+            - target_sizes (dict): the desired size of the cropped or padded axes.
+            - shared (bool): whether the cropped or padded volume is allocated in shared memory.
+
+        Returns:
+            - (torch.Tensor): the cropped or padded volume.
+        """
+        shape = [target_sizes.get(axis, size) for axis, size in enumerate(volume.shape)]
+        output = utils.allocate_tensor(tuple(shape), shared=shared).to(volume.dtype)
+
+        src, dst = list(), list()
+        for size, target_size in zip(volume.shape, shape):
+            if size >= target_size:
+                start = math.ceil((size - target_size) / 2)
+                src.append(slice(start, start + target_size))
+                dst.append(slice(0, target_size))
+            else:
+                start = math.ceil((target_size - size) / 2)
+                src.append(slice(0, size))
+                dst.append(slice(start, start + size))
+
+        output[tuple(dst)] = volume[tuple(src)]
+        utils.count_volume_copy("crop_or_pad")
+        return output
+
+    def _get_positions(self, size: int, input_spacing: float, output_spacing: float, target_size: int) -> tuple:
+        """
+        Returns the input positions sampled along an axis, the crop or pad being folded into them.
+
+        Voxels are centered: the output voxel i samples the input coordinate (i + 0.5) * ratio - 0.5, clamped to
+        the input; the padded voxels are outside the resampled axis and set to 0.
+
+        Parameters:
+            - size (int): the axis' size.
+            - input_spacing (float): the axis' spacing.
+            - output_spacing (float): the desired spacing.
+            - target_size (int): the desired size, after crop or pad.
+
+        Returns:
+            - (torch.Tensor): the sampled positions, normalized to [-1, 1] as grid_sample with align_corners.
+            - (torch.Tensor): the padded output indexes.
+        """
+        resampled_size = self.get_resampled_size(size, input_spacing, output_spacing)
+        if resampled_size >= target_size:
+            offset = math.ceil((resampled_size - target_size) / 2)
+        else:
+            offset = -math.ceil((target_size - resampled_size) / 2)
+
+        resampled_idx = torch.arange(target_size, dtype=torch.float64) + offset
+        position = ((resampled_idx + 0.5) * (output_spacing / input_spacing) - 0.5).clamp(0, size - 1)
+        outside = torch.nonzero((resampled_idx < 0) | (resampled_idx >= resampled_size)).flatten()
+
+        return position / max(size - 1, 1) * 2 - 1, outside
@@ -6,12 +6,16 @@ Version: 1.1
 Purpose:
 """
 
-# IMPORT: file loading
-import pydicom
+# IMPORT: data processing
+import numpy as np
 
 # IMPORT: tensor
 import torch
-import torchio as tio
+
+# IMPORT: project
+import utils
+
+from .geometry import GeometryEngine
 
 
 class PostProcessor:
@@ -25,6 +29,8 @@ class PostProcessor:
         self._default_spacing = (2., 1.5234375, 1.5234375)
         self._params = params
 
+        self._geometry = GeometryEngine(self._default_spacing)
+
     def launch(self, volume: torch.Tensor, meta_data: dict) -> torch.Tensor:
         """
         Launches and applies post-processing.
@@ -36,27 +42,24 @@ class PostProcessor:
         Returns:
             - (torch.Tensor): the post-processed volume.
         """
-        # RESAMPLE
-        if meta_data["spacing"] != self._default_spacing:
-            volume = self._resample(volume, meta_data["spacing"])
-
-        # CROP TO EXPECTED SHAPE
-        volume = self._crop_or_pad(volume, meta_data["shape"])
+        # RESAMPLE AND CROP TO EXPECTED SHAPE
+        volume = self._geometry.from_model_grid(volume, meta_data["spacing"], meta_data["shape"])
 
         # REVERSE IF NOT GOOD POSITION
         if meta_data["position"] != "HFS":
             volume = torch.flip(volume, [0, 1])
+            utils.count_volume_copy("flip")
 
         # RESCALE INTENSITY
         if self._params["rescale_intensity"]:
-            for slice_idx in range(volume.shape[1]):
-                volume[:, slice_idx] = self._rescale_intensity(
-                    volume[:, slice_idx], meta_data["files"][slice_idx]
-                )
+            volume = self._rescale_intensity(volume, meta_data["rescale_slope"], meta_data["rescale_intercept"])
 
         # CLIP INTENSITY
-        if self._params["clip_value"] > 0:
+        if self._params["clip_value"] > 0 and self._params.get("zero_copy", False):
+            volume = volume.clamp_(0, self._params["clip_value"])
+        elif self._params["clip_value"] > 0:
             volume = torch.clip(volume, 0, self._params["clip_value"])
+            utils.count_volume_copy("clip")
 
         # CROP OR PAD AND CROP Z-AXIS
         if self._params["crop_value"] > 0:
@@ -64,26 +67,6 @@ class PostProcessor:
 
         return volume
 
-    def _resample(self, volume: torch.Tensor, target_spacing: tuple) -> torch.Tensor:
-        """
-        Resamples volume according to the desired spacing.
-
-        Parameters:
-            - volume (torch.Tensor): the volume to resample.
-            - target_spacing (dict): the desired slice spacing.
-
-        Returns:
-            - (torch.Tensor): the resampled volume.
-        """
-        return tio.Resample(
-            target=(
-                1 / (self._default_spacing[0] / target_spacing[0]),
-                1 / (self._default_spacing[1] / target_spacing[1]),
-                1 / (self._default_spacing[2] / target_spacing[2])
-            ),
-            image_interpolation="linear"
-        )(volume)
-
     @staticmethod
     def _crop_or_pad(volume: torch.Tensor, target_shape: tuple, crop_value: int = 0) -> torch.Tensor:
         """
@@ -97,24 +80,29 @@ class PostProcessor:
         Returns:
             - (torch.Tensor): the cropped or padded volume.
         """
+        # IMPORT: tensor, only loaded when a crop value is set
+        import torchio as tio
+
         if crop_value > 0:
             volume = volume[:, crop_value:-crop_value]
+
+        utils.count_volume_copy("crop_value")
         return tio.CropOrPad(target_shape, padding_mode=0)(volume).data
 
     @staticmethod
-    def _rescale_intensity(volume: torch.Tensor, dicom_file: pydicom.Dataset):
+    def _rescale_intensity(volume: torch.Tensor, rescale_slope: np.ndarray, rescale_intercept: np.ndarray):
         """
-        Rescales volume's intensity using dicom's metadata.
+        Rescales volume's intensity in place using the slices' metadata.
 
         Parameters:
             - volume (torch.Tensor): the volume to rescale intensity.
-            - dicom_file (pydicom.DicomFile): the dicom file containing metadata.
+            - rescale_slope (np.ndarray): the slices' RescaleSlope.
+            - rescale_intercept (np.ndarray): the slices' RescaleIntercept.
 
         Returns:
             - (torch.Tensor): the rescaled volume.
         """
-        # Get acquisition and injection time
-        rescale_slope = dicom_file.get("RescaleSlope")
-        rescale_intercept = dicom_file.get("RescaleIntercept")
-
-        return (volume - rescale_intercept) / rescale_slope
+        shape = (1, -1, 1, 1)
+        return volume.sub_(torch.from_numpy(rescale_intercept).view(shape)).div_(
+            torch.from_numpy(rescale_slope).view(shape)
+        )
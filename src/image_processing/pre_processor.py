@@ -6,18 +6,34 @@ Version: 1.1
 Purpose:
 """
 
+# IMPORT: data processing
+import numpy as np
+
 # IMPORT: tensor
 import torch
-import torchio as tio
+
+# IMPORT: project
+import utils
+
+from .geometry import GeometryEngine
 
 
 class PreProcessor:
-    def __init__(self):
+    def __init__(self, tile_size: int = None, shared: bool = False):
         """
         Initializes an instance of PreProcessor class.
+
+        Parameters:
+            - tile_size (int): the in-plane tile size of the tiled inference; if set, the resampled planes are not
+              cropped, only padded up to the tile size.
+            - shared (bool): whether the pre-processed volumes are written in shared memory, for the data parallel
+              workers.
         """
         self._default_spacing = (2., 1.5234375, 1.5234375)
-        self._desired_shape = 512
+        self._desired_shape = 512 if tile_size is None else None
+        self._shared = shared
+
+        self._geometry = GeometryEngine(self._default_spacing, self._desired_shape, min_shape=tile_size or 0)
 
     def launch(self, volume: torch.Tensor, meta_data: dict):
         """
@@ -31,73 +47,131 @@ class PreProcessor:
             - (torch.Tensor): the pre-processed volume.
         """
         # RESCALE INTENSITY
-        for slice_idx in range(volume.shape[1]):
-            volume[:, slice_idx] = self._rescale_intensity(
-                volume[:, slice_idx], meta_data["files"][slice_idx]
-            )
+        volume = self._rescale_intensity(volume, meta_data["rescale_slope"], meta_data["rescale_intercept"])
 
         # REVERSE IF NOT GOOD POSITION
         if meta_data["position"] != "HFS":
             volume = torch.flip(volume, [0, 1])
+            utils.count_volume_copy("flip")
 
-        # RESAMPLE
-        if meta_data["spacing"] != self._default_spacing:
-            volume = self._resample(volume, meta_data["spacing"])
-
-        # CROP OR PAD
-        if meta_data["shape"] != (meta_data["shape"][0], self._desired_shape, self._desired_shape):
-            volume = self._crop_or_pad(volume)
+        # RESAMPLE AND CROP OR PAD
+        volume = self._geometry.to_model_grid(volume, meta_data["spacing"], shared=self._shared)
 
         return volume
 
-    def _resample(self, volume, input_spacing):
+    def iter_slices(self, slices, meta_data: dict):
+        """
+        Applies pre-processing one slice at a time, only two input slices are held at once.
+
+        Parameters:
+            - slices (Sequence[np.ndarray]): the slices to pre-process, sorted along the z-axis.
+            - meta_data (dict): the input file's metadata.
+
+        Returns:
+            - (Iterator[torch.Tensor]): the pre-processed slices.
+        """
+        # REVERSE IF NOT GOOD POSITION
+        slices_idx = range(len(slices))
+        if meta_data["position"] != "HFS":
+            slices_idx = reversed(slices_idx)
+
+        # RESCALE INTENSITY, RESAMPLE AND CROP OR PAD IN-PLANE
+        processed_slices = (
+            self._process_slice(
+                slices[i], meta_data["rescale_slope"][i], meta_data["rescale_intercept"][i], meta_data["spacing"]
+            ) for i in slices_idx
+        )
+
+        # RESAMPLE Z-AXIS
+        if meta_data["spacing"][0] == self._default_spacing[0]:
+            return processed_slices
+        return self._resample_z(processed_slices, len(slices), meta_data["spacing"][0])
+
+    def get_output_depth(self, depth: int, z_spacing: float) -> int:
         """
-        Resamples volume according to the desired spacing.
+        Returns the number of slices after pre-processing.
 
         Parameters:
-            - volume (torch.Tensor): the volume to resample.
-            - input_spacing (dict): the desired slice spacing.
+            - depth (int): the number of input slices.
+            - z_spacing (float): the input z-axis spacing.
 
         Returns:
-            - (torch.Tensor): the resampled volume.
+            - (int): the number of pre-processed slices.
         """
-        return tio.Resample(
-            target=(
-                1 / (input_spacing[0] / self._default_spacing[0]),
-                1 / (input_spacing[1] / self._default_spacing[1]),
-                1 / (input_spacing[2] / self._default_spacing[2])
-            ),
-            image_interpolation="linear"
-        )(volume)
+        return self._geometry.get_resampled_size(depth, z_spacing, self._default_spacing[0])
 
-    def _crop_or_pad(self, volume):
+    def get_output_plane_shape(self, plane_shape: tuple, spacing: tuple) -> tuple:
         """
-        Crops or pads volume according to the desired shape.
+        Returns the in-plane shape after pre-processing.
 
         Parameters:
-            - volume (torch.Tensor): the volume to crop or pad.
+            - plane_shape (tuple): the input in-plane shape.
+            - spacing (tuple): the input spacing.
 
         Returns:
-            - (torch.Tensor): the cropped or padded volume.
+            - (tuple): the pre-processed in-plane shape.
         """
-        return tio.CropOrPad(
-            (volume.shape[1], self._desired_shape, self._desired_shape), padding_mode=0
-        )(volume).data
+        return self._geometry.get_plane_shape(plane_shape, spacing)
+
+    def _process_slice(self, pixels, rescale_slope, rescale_intercept, input_spacing):
+        """
+        Rescales intensity, resamples and crops or pads a slice.
+
+        Parameters:
+            - pixels (np.ndarray): the slice to pre-process.
+            - rescale_slope (float): the slice's RescaleSlope.
+            - rescale_intercept (float): the slice's RescaleIntercept.
+            - input_spacing (tuple): the input spacing.
+
+        Returns:
+            - (torch.Tensor): the pre-processed slice.
+        """
+        pixels = torch.from_numpy(np.asarray(pixels, dtype=np.float32))
+        pixels = pixels * float(rescale_slope) + float(rescale_intercept)
+
+        return self._geometry.transform_plane(pixels, input_spacing)
+
+    def _resample_z(self, slices, depth, input_spacing):
+        """
+        Linearly resamples a stream of slices along the z-axis.
+
+        Parameters:
+            - slices (Iterator[torch.Tensor]): the slices to resample.
+            - depth (int): the number of input slices.
+            - input_spacing (float): the input z-axis spacing.
+
+        Returns:
+            - (Iterator[torch.Tensor]): the resampled slices.
+        """
+        scale = self._default_spacing[0] / input_spacing
+        window, loaded = dict(), -1
+
+        for slice_idx in range(self.get_output_depth(depth, input_spacing)):
+            position = min(max((slice_idx + 0.5) * scale - 0.5, 0), depth - 1)
+            low, high = int(position), min(int(position) + 1, depth - 1)
+
+            while loaded < high:
+                loaded += 1
+                window[loaded] = next(slices)
+                window.pop(loaded - 2, None)
+
+            weight = position - low
+            yield window[low] * (1 - weight) + window[high] * weight
 
     @staticmethod
-    def _rescale_intensity(volume, dicom_file):
+    def _rescale_intensity(volume, rescale_slope, rescale_intercept):
         """
-        Rescales volume's intensity using dicom's metadata.
+        Rescales volume's intensity in place using the slices' metadata.
 
         Parameters:
             - volume (torch.Tensor): the volume to rescale intensity.
-            - dicom_file (pydicom.DicomFile): the dicom file containing metadata.
+            - rescale_slope (np.ndarray): the slices' RescaleSlope.
+            - rescale_intercept (np.ndarray): the slices' RescaleIntercept.
 
         Returns:
             - (torch.Tensor): the rescaled volume.
         """
-        # Get acquisition and injection time
-        rescale_slope = dicom_file.get("RescaleSlope")
-        rescale_intercept = dicom_file.get("RescaleIntercept")
-
-        return (volume * rescale_slope) + rescale_intercept
+        shape = (1, -1, 1, 1)
+        return volume.mul_(torch.from_numpy(rescale_slope).view(shape)).add_(
+            torch.from_numpy(rescale_intercept).view(shape)
+        )
@@ -0,0 +1,5 @@
+from .inference_engine import InferenceEngine, compare_engines
+from .autotuner import Autotuner, load_tuning
+from .data_parallel import DataParallelPredictor
+from .onnx_engine import ONNXEngine, export_onnx, load_onnx_engine
+from .tiled_engine import TiledEngine
@@ -0,0 +1,207 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Calibrates the batch size and the number of threads of the inference.
+"""
+
+# IMPORT: utils
+import os
+import json
+import time
+import socket
+
+# IMPORT: deep learning
+import torch
+
+# IMPORT: projet
+import paths
+import utils
+
+
+def get_tuning_config(params: dict) -> dict:
+    """
+    Returns the inference parameters changing the best configuration and the memory used.
+
+    Parameters:
+        - params (dict): the inference parameters.
+
+    Returns:
+        - (dict): the precision, the backend, the tile size (None without tiling) and the model loading mode.
+    """
+    return {
+        "precision": params.get("precision", "fp32"),
+        "backend": params.get("backend", "torch"),
+        "tile_size": params.get("tile_size", 512) if params.get("tiling", False) else None,
+        "model_loading": params.get("model_loading", "eager")
+    }
+
+
+def get_tuning_path(params: dict) -> str:
+    """
+    Returns the path of the current host's tuning for the inference parameters.
+
+    Parameters:
+        - params (dict): the inference parameters.
+
+    Returns:
+        - (str): the tuning's path.
+    """
+    config = get_tuning_config(params)
+    tiling = "full" if config["tile_size"] is None else f"tile{config['tile_size']}"
+    name = "_".join([socket.gethostname(), config["precision"], config["backend"], tiling, config["model_loading"]])
+
+    return os.path.join(paths.AUTOTUNE_PATH, f"{name}.json")
+
+
+def load_tuning(params: dict) -> dict:
+    """
+    Loads the current host's tuning for the inference parameters.
+
+    Parameters:
+        - params (dict): the inference parameters.
+
+    Returns:
+        - (dict): the best batch size and number of threads, None if the host was never tuned with them.
+    """
+    if not os.path.exists(get_tuning_path(params)):
+        return None
+
+    with open(get_tuning_path(params)) as tuning_file:
+        return json.load(tuning_file)
+
+
+class Autotuner:
+    _BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+
+    def __init__(self, engine, in_channels: int, memory_budget: int, params: dict, repeats: int = 3):
+        """
+        Initializes an instance of Autotuner class.
+
+        Parameters:
+            - engine (callable): the inference engine to calibrate.
+            - in_channels (int): the number of in channels.
+            - memory_budget (int): the maximum memory growth allowed during inference, in bytes.
+            - params (dict): the inference parameters, the tuning is saved for their configuration.
+            - repeats (int): the number of timed predictions per configuration.
+        """
+        self._engine = engine
+        self._in_channels = in_channels
+        self._memory_budget = memory_budget
+        self._params = params
+        self._repeats = repeats
+
+        # The synthetic planes are the ones the model sees: a tile, or a plane of the model grid
+        self._plane_size = get_tuning_config(params)["tile_size"] or 512
+
+    def launch(self) -> dict:
+        """
+        Measures the throughput of every batch size and number of threads, saves the best one.
+
+        Returns:
+            - (dict): the best configuration and every measure.
+        """
+        cpu_count = os.cpu_count()
+        threads = sorted({2 ** i for i in range(cpu_count.bit_length()) if 2 ** i <= cpu_count} | {cpu_count})
+
+        # A batch size is only run if its estimated footprint fits, then its measured footprint must fit too
+        measures, footprints = list(), dict()
+        for batch_size in self._BATCH_SIZES:
+            if self._estimate_footprint(footprints, batch_size) > self._memory_budget:
+                break
+
+            footprints[batch_size] = self._get_footprint(batch_size)
+            if footprints[batch_size] > self._memory_budget:
+                break
+
+            for num_threads in threads:
+                torch.set_num_threads(num_threads)
+                measures.append({
+                    "batch_size": batch_size, "num_threads": num_threads,
+                    "footprint": footprints[batch_size], **self._measure(batch_size)
+                })
+
+        if not measures:
+            raise ValueError("No batch size fits into the memory budget.")
+
+        best = max(measures, key=lambda m: m["throughput"])
+        tuning = {
+            "batch_size": best["batch_size"], "num_threads": best["num_threads"],
+            "config": get_tuning_config(self._params), "measures": measures
+        }
+        self._save(tuning)
+
+        return tuning
+
+    def _measure(self, batch_size: int) -> dict:
+        """
+        Measures the throughput of a batch size on a synthetic input.
+
+        Parameters:
+            - batch_size (int): the batch size.
+
+        Returns:
+            - (dict): the throughput in patches per second.
+        """
+        batch = torch.rand((batch_size, self._in_channels, self._plane_size, self._plane_size))
+        self._engine(batch)
+
+        start = time.perf_counter()
+        for _ in range(self._repeats):
+            self._engine(batch)
+
+        return {"throughput": batch_size * self._repeats / (time.perf_counter() - start)}
+
+    def _get_footprint(self, batch_size: int) -> int:
+        """
+        Measures the memory growth of a single prediction.
+
+        The peak is reset before the prediction on Linux; elsewhere it is the process' lifetime peak, which can
+        only overestimate the footprint.
+
+        Parameters:
+            - batch_size (int): the batch size.
+
+        Returns:
+            - (int): the footprint, in bytes.
+        """
+        utils.reset_peak_rss()
+        base_rss = utils.get_rss()
+        self._engine(torch.rand((batch_size, self._in_channels, self._plane_size, self._plane_size)))
+
+        return max(0, utils.get_peak_rss() - base_rss)
+
+    @staticmethod
+    def _estimate_footprint(footprints: dict, batch_size: int) -> float:
+        """
+        Extrapolates the footprint of a batch size from the measured ones.
+
+        Parameters:
+            - footprints (dict): the measured footprints, by batch size.
+            - batch_size (int): the batch size to estimate.
+
+        Returns:
+            - (float): the estimated footprint in bytes, 0 if nothing was measured yet.
+        """
+        if not footprints:
+            return 0.
+
+        sizes = sorted(footprints)
+        if len(sizes) == 1:
+            # Scaling the whole footprint overestimates its fixed part, which is safe
+            return footprints[sizes[0]] * batch_size / sizes[0]
+
+        per_patch = max(0, footprints[sizes[-1]] - footprints[sizes[-2]]) / (sizes[-1] - sizes[-2])
+        return footprints[sizes[-1]] + per_patch * (batch_size - sizes[-1])
+
+    def _save(self, tuning: dict):
+        """
+        Saves the current host's tuning.
+
+        Parameters:
+            - tuning (dict): the tuning to save.
+        """
+        os.makedirs(paths.AUTOTUNE_PATH, exist_ok=True)
+        with open(get_tuning_path(self._params), "w") as tuning_file:
+            json.dump(tuning, tuning_file, indent=4)
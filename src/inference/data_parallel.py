@@ -0,0 +1,183 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Shares the inference of a volume between several processes.
+"""
+
+# IMPORT: utils
+import os
+import math
+import queue
+
+# IMPORT: deep learning
+import torch
+import torch.multiprocessing as mp
+
+# IMPORT: projet
+import utils
+
+from .inference_engine import InferenceEngine
+from .tiled_engine import TiledEngine
+
+
+def _worker_loop(model, patcher, channels_last: bool, tiling: tuple, num_threads: int, cores: list,
+                 tasks: mp.Queue, done: mp.Queue):
+    """
+    Predicts the shards received until a None task is received.
+
+    Parameters:
+        - model (torch.nn.Module): the model, its weights are in shared memory.
+        - patcher (Patcher): the patcher writing the predictions into the output volume.
+        - channels_last (bool): whether to feed the batches in the channels_last memory format on CPU.
+        - tiling (tuple): the tiles' size and overlap, no tiling if None.
+        - num_threads (int): the worker's number of threads.
+        - cores (list): the CPU cores the worker is pinned to, all of them if empty.
+        - tasks (mp.Queue): the shards to predict, with the engine's precision.
+        - done (mp.Queue): the shards' completion messages, None or the raised error.
+    """
+    torch.set_num_threads(num_threads)
+    try:
+        if cores and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, cores)
+    except OSError:
+        # A cgroup CPU limit may forbid some cores, the worker then runs unpinned
+        pass
+
+    # One engine per precision, the predictor may fall back to fp32 after its tolerance check; the engines only
+    # wrap the shared model, none of them copies its weights
+    engines = dict()
+    while (task := tasks.get()) is not None:
+        input_patches, output, start, stop, batch_size, precision = task
+        try:
+            if precision not in engines:
+                engine = InferenceEngine(model, precision=precision, channels_last=channels_last)
+                engines[precision] = engine if tiling is None else TiledEngine(engine, *tiling)
+
+            for i in range(start, stop, batch_size):
+                patcher.insert_patches(output, engines[precision](input_patches[i: min(i + batch_size, stop)]), i)
+            done.put(None)
+        except Exception as error:
+            done.put(repr(error))
+
+
+class DataParallelPredictor:
+    # The delay between two checks of the workers' liveness while waiting for them, in seconds
+    _POLL_INTERVAL = 1.
+
+    def __init__(self, model: torch.nn.Module, patcher, num_workers: int,
+                 channels_last: bool = False, tiling: tuple = None):
+        """
+        Initializes an instance of DataParallelPredictor class, its workers stay alive between volumes.
+
+        Parameters:
+            - model (torch.nn.Module): the fp32 model to run, already in its final memory format.
+            - patcher (Patcher): the patcher writing the predictions into the output volume.
+            - num_workers (int): the number of worker processes.
+            - channels_last (bool): whether to feed the batches in the channels_last memory format on CPU.
+            - tiling (tuple): the tiles' size and overlap, no tiling if None.
+        """
+        if isinstance(model, torch.jit.ScriptModule):
+            raise ValueError("Data parallel inference needs an eager model.")
+
+        # The weights are shared with the workers instead of being copied
+        model.share_memory()
+
+        context = mp.get_context("spawn")
+        cpu_count = os.cpu_count()
+        num_threads = max(1, cpu_count // num_workers)
+
+        self._tasks = [context.Queue() for _ in range(num_workers)]
+        self._done = context.Queue()
+        self._workers = list()
+
+        for worker_idx, tasks in enumerate(self._tasks):
+            cores = list(range(worker_idx * num_threads, (worker_idx + 1) * num_threads))
+            worker = context.Process(
+                target=_worker_loop,
+                args=(model, patcher, channels_last, tiling, num_threads,
+                      cores if cores[-1] < cpu_count else [], tasks, self._done),
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def predict(self, input_patches: torch.Tensor, output: torch.Tensor, batch_size: int,
+                precision: str = "fp32") -> torch.Tensor:
+        """
+        Predicts the patches, each worker handles a contiguous range of batches.
+
+        The batches are the same as in the single process loop, so every patch lands at the same z-offset.
+
+        Parameters:
+            - input_patches (torch.Tensor): the patches to predict.
+            - output (torch.Tensor): the aggregated volume to fill.
+            - batch_size (int): the number of patches per batch.
+            - precision (str): the autocast precision, the one of the predictor's current engine.
+
+        Returns:
+            - (torch.Tensor): the filled aggregated volume, in shared memory.
+        """
+        if precision == "int8":
+            raise ValueError("The int8 precision is not supported with data parallel inference.")
+        self._check_workers()
+
+        # The predictor allocates both in shared memory, moving another tensor there copies its whole storage
+        for tensor in (input_patches, output):
+            if not tensor.is_shared():
+                tensor.share_memory_()
+                utils.count_volume_copy("share_memory")
+
+        num_batches = math.ceil(input_patches.shape[0] / batch_size)
+        batches_per_worker = math.ceil(num_batches / len(self._workers))
+
+        num_tasks = 0
+        for worker_idx, tasks in enumerate(self._tasks):
+            start = worker_idx * batches_per_worker * batch_size
+            stop = min((worker_idx + 1) * batches_per_worker * batch_size, input_patches.shape[0])
+            if start >= stop:
+                break
+
+            tasks.put((input_patches, output, start, stop, batch_size, precision))
+            num_tasks += 1
+
+        errors = list()
+        while num_tasks > 0:
+            try:
+                error = self._done.get(timeout=self._POLL_INTERVAL)
+            except queue.Empty:
+                self._check_workers()
+                continue
+
+            num_tasks -= 1
+            if error is not None:
+                errors.append(error)
+
+        if errors:
+            raise RuntimeError(f"Data parallel inference failed: {errors[0]}")
+
+        return output
+
+    def close(self, timeout: float = 10.):
+        """
+        Stops the workers, the ones still running after the timeout are terminated.
+
+        Parameters:
+            - timeout (float): the delay given to each worker to stop, in seconds.
+        """
+        for tasks, worker in zip(self._tasks, self._workers):
+            if worker.is_alive():
+                tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+
+    def _check_workers(self):
+        """
+        Raises if a worker died, its shard would never be completed.
+        """
+        for worker_idx, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                raise RuntimeError(f"Data parallel worker {worker_idx} died, exit code {worker.exitcode}.")
@@ -0,0 +1,101 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Runs a model in inference mode.
+"""
+
+# IMPORT: utils
+import time
+
+# IMPORT: deep learning
+import torch
+
+
+class InferenceEngine:
+    _PRECISIONS = {"fp32": None, "bf16": torch.bfloat16, "int8": None}
+
+    def __init__(self, model: torch.nn.Module, precision: str = "fp32", channels_last: bool = False):
+        """
+        Initializes an instance of InferenceEngine class.
+
+        Parameters:
+            - model (torch.nn.Module): the model to run.
+            - precision (str): the precision, "fp32", "bf16" autocast or "int8" dynamic quantization (CPU only).
+            - channels_last (bool): whether to feed the batches in the channels_last memory format on CPU, the model
+              is converted once by its owner so the engines share its weights.
+        """
+        if precision not in self._PRECISIONS:
+            raise ValueError(f"Unknown precision: {precision}.")
+
+        self._model = model.eval()
+        self._device = next(model.parameters()).device
+
+        self.precision = precision
+        if precision == "int8":
+            if self._device.type != "cpu":
+                raise ValueError("int8 dynamic quantization only runs on CPU.")
+
+            # The Linear layers of the Swin transformer blocks run in int8, the original model stays in fp32
+            self._model = torch.ao.quantization.quantize_dynamic(
+                self._model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+
+        self._channels_last = channels_last and self._device.type == "cpu"
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        """
+        Predicts a batch.
+
+        Parameters:
+            - batch (torch.Tensor): the batch to predict.
+
+        Returns:
+            - (torch.Tensor): the fp32 prediction, on CPU.
+        """
+        batch = batch.to(self._device)
+        if self._channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+
+        with torch.inference_mode(), torch.autocast(
+                device_type=self._device.type,
+                dtype=self._PRECISIONS[self.precision],
+                enabled=self._PRECISIONS[self.precision] is not None
+        ):
+            return self._model(batch).float().cpu()
+
+
+def compare_engines(reference, candidate, batch: torch.Tensor, atol: float = 1e-2, repeats: int = 3) -> dict:
+    """
+    Compares a candidate engine's output and speed against a reference engine.
+
+    Parameters:
+        - reference (callable): the reference engine, usually the fp32 one.
+        - candidate (callable): the engine to evaluate.
+        - batch (torch.Tensor): the batch to predict.
+        - atol (float): the maximum absolute error tolerated.
+        - repeats (int): the number of timed predictions per engine.
+
+    Returns:
+        - (dict): the errors, the timings and whether the candidate is within tolerance.
+    """
+    timings = list()
+    predictions = list()
+    for engine in (reference, candidate):
+        predictions.append(engine(batch))
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            engine(batch)
+        timings.append((time.perf_counter() - start) / repeats)
+
+    error = torch.abs(predictions[0] - predictions[1])
+    return {
+        "max_abs_error": float(error.max()),
+        "mean_abs_error": float(error.mean()),
+        "within_tolerance": bool(error.max() <= atol),
+        "reference_seconds": timings[0],
+        "candidate_seconds": timings[1],
+        "speedup": timings[0] / timings[1]
+    }
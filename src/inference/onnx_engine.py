@@ -0,0 +1,117 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Runs the model exported to ONNX with onnxruntime's CPU execution provider.
+"""
+
+# IMPORT: utils
+import os
+import copy
+
+# IMPORT: deep learning
+import torch
+
+
+def get_onnx_path(weights_path: str, in_channels: int, plane_size: int = 512) -> str:
+    """
+    Returns the path of the ONNX export cached next to the weights.
+
+    Parameters:
+        - weights_path (str): the model weights' path.
+        - in_channels (int): the number of in channels.
+        - plane_size (int): the in-plane size the model is exported for.
+
+    Returns:
+        - (str): the ONNX export's path.
+    """
+    return f"{os.path.splitext(weights_path)[0]}_{in_channels}c_{plane_size}px.onnx"
+
+
+def export_onnx(model: torch.nn.Module, weights_path: str, in_channels: int, plane_size: int = 512) -> str:
+    """
+    Exports the model to ONNX next to its weights, with a dynamic batch axis.
+
+    The export is traced, SwinUNETR's padding and window masks depend on the in-plane size: one export is made
+    per plane size instead of marking the in-plane axes dynamic.
+
+    Parameters:
+        - model (torch.nn.Module): the model to export, left on its device.
+        - weights_path (str): the model weights' path.
+        - in_channels (int): the number of in channels.
+        - plane_size (int): the in-plane size of every input, the model grid's or the tiles' one.
+
+    Returns:
+        - (str): the ONNX export's path.
+    """
+    if weights_path is None:
+        raise ValueError("The ONNX export needs a weights file.")
+
+    onnx_path = get_onnx_path(weights_path, in_channels, plane_size)
+
+    # Written under a temporary name so concurrent workers never load a partial export
+    tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            copy.deepcopy(model).cpu().eval(), torch.zeros((1, in_channels, plane_size, plane_size)), tmp_path,
+            input_names=["input"], output_names=["output"],
+            dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+            opset_version=17
+        )
+    os.replace(tmp_path, onnx_path)
+
+    return onnx_path
+
+
+def load_onnx_engine(weights_path: str, in_channels: int, plane_size: int = 512):
+    """
+    Loads the ONNX engine if onnxruntime is installed and the export is up to date.
+
+    Parameters:
+        - weights_path (str): the model weights' path.
+        - in_channels (int): the number of in channels.
+        - plane_size (int): the in-plane size of every input.
+
+    Returns:
+        - (ONNXEngine): the ONNX engine, None if it can not be used.
+    """
+    onnx_path = get_onnx_path(weights_path, in_channels, plane_size)
+    if not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(weights_path):
+        return None
+
+    try:
+        return ONNXEngine(onnx_path)
+    except ImportError:
+        return None
+
+
+class ONNXEngine:
+    def __init__(self, onnx_path: str):
+        """
+        Initializes an instance of ONNXEngine class.
+
+        Parameters:
+            - onnx_path (str): the ONNX export's path.
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+
+        self._session = ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.precision = "onnx"
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        """
+        Predicts a batch.
+
+        Parameters:
+            - batch (torch.Tensor): the batch to predict.
+
+        Returns:
+            - (torch.Tensor): the fp32 prediction, on CPU.
+        """
+        batch = batch.detach().cpu().contiguous().numpy()
+        return torch.from_numpy(self._session.run(["output"], {"input": batch})[0])
@@ -0,0 +1,95 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Predicts planes of any size with overlapping in-plane tiles, blended with a linear window.
+"""
+
+# IMPORT: deep learning
+import torch
+
+
+class TiledEngine:
+    # SwinUNETR downsamples its input 5 times
+    _SIZE_MULTIPLE = 32
+
+    def __init__(self, engine, tile_size: int = 512, overlap: float = 0.25):
+        """
+        Initializes an instance of TiledEngine class.
+
+        Parameters:
+            - engine (InferenceEngine | ONNXEngine): the engine predicting each tile.
+            - tile_size (int): the tiles' in-plane size, a multiple of 32.
+            - overlap (float): the fraction of a tile shared with its neighbours, in [0, 1).
+        """
+        if tile_size <= 0 or tile_size % self._SIZE_MULTIPLE != 0:
+            raise ValueError(f"The tile size must be a positive multiple of {self._SIZE_MULTIPLE}: {tile_size}.")
+        if not 0 <= overlap < 1:
+            raise ValueError(f"The tile overlap must be in [0, 1): {overlap}.")
+
+        self._engine = engine
+        self._tile_size = tile_size
+        self._stride = max(1, round(tile_size * (1 - overlap)))
+
+        # The weights decrease linearly over the overlap, every pixel keeps a positive weight
+        ramp_size = tile_size - self._stride
+        ramp = torch.ones(tile_size)
+        ramp[:ramp_size] = torch.arange(1, ramp_size + 1) / (ramp_size + 1)
+        ramp = torch.minimum(ramp, ramp.flip(0))
+        self._window = torch.outer(ramp, ramp)
+
+    @property
+    def precision(self) -> str:
+        """
+        Returns the tiles' engine precision.
+
+        Returns:
+            - (str): the precision.
+        """
+        return self._engine.precision
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        """
+        Predicts a batch tile by tile, only one tile of every patch is in the model at once.
+
+        Parameters:
+            - batch (torch.Tensor): the batch to predict, (B, C, H, W) with H and W at least the tile size.
+
+        Returns:
+            - (torch.Tensor): the fp32 prediction, on CPU.
+        """
+        height, width = batch.shape[-2:]
+        if height <= self._tile_size and width <= self._tile_size:
+            return self._engine(batch)
+
+        output, weights = None, torch.zeros((height, width))
+        for top in self._get_starts(height):
+            for left in self._get_starts(width):
+                tile = self._engine(batch[..., top: top + self._tile_size, left: left + self._tile_size])
+                if output is None:
+                    output = torch.zeros((batch.shape[0], tile.shape[1], height, width))
+
+                window = self._window[:tile.shape[-2], :tile.shape[-1]]
+                output[..., top: top + tile.shape[-2], left: left + tile.shape[-1]] += tile * window
+                weights[top: top + tile.shape[-2], left: left + tile.shape[-1]] += window
+
+        return output.div_(weights)
+
+    def _get_starts(self, size: int) -> list:
+        """
+        Returns the tiles' first indexes along an axis, the last tile ends on the axis' end.
+
+        Parameters:
+            - size (int): the axis' size.
+
+        Returns:
+            - (list): the tiles' first indexes.
+        """
+        if size <= self._tile_size:
+            return [0]
+
+        starts = list(range(0, size - self._tile_size + 1, self._stride))
+        if starts[-1] != size - self._tile_size:
+            starts.append(size - self._tile_size)
+        return starts
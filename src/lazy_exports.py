@@ -0,0 +1,36 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Exports a package's names lazily, so importing the package never loads the backends it does not use.
+"""
+
+# IMPORT: utils
+import sys
+import importlib
+
+
+def lazy_exports(package: str, exports: dict) -> tuple:
+    """
+    Builds a package's __all__, __getattr__ and __dir__ (PEP 562), the exported names' modules are imported on
+    first access.
+
+    Parameters:
+        - package (str): the package's __name__.
+        - exports (dict): the exported names' modules, relative to the package.
+
+    Returns:
+        - (list): the package's __all__.
+        - (callable): the package's __getattr__.
+        - (callable): the package's __dir__.
+    """
+    def __getattr__(name: str):
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        return getattr(importlib.import_module(exports[name], package), name)
+
+    def __dir__() -> list:
+        return sorted(set(vars(sys.modules[package])) | set(exports))
+
+    return list(exports), __getattr__, __dir__
@@ -1 +1,13 @@
-from .file_loading import DicomLoader, NRRDLoader
+from src.lazy_exports import lazy_exports
+
+__all__, __getattr__, __dir__ = lazy_exports(__name__, {
+    "DicomLoader": ".file_loading.dicom_loading",
+    "NRRDLoader": ".file_loading.nrrd_loading",
+    "NumpyLoader": ".file_loading.numpy_loading",
+    "NumpyCompressedLoader": ".file_loading.numpy_loading",
+    "NIfTILoader": ".file_loading.nifti_loading",
+    "register_loader": ".loader_registry",
+    "get_file_types": ".loader_registry",
+    "detect_file_type": ".loader_registry",
+    "build_loader": ".loader_registry"
+})
@@ -0,0 +1,216 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Indexes a dicom directory's headers on disk, so its series are listed and selected without pixel I/O.
+"""
+
+# IMPORT: utils
+import os
+import json
+import sqlite3
+import hashlib
+import contextlib
+
+# IMPORT: data loading
+import pydicom
+from pydicom.errors import InvalidDicomError
+
+# IMPORT: project
+import paths
+import utils
+
+
+def read_index_entry(file_path: str) -> tuple:
+    """
+    Reads a file's dicom header without its pixels.
+
+    Parameters:
+        - file_path (str): the file's path.
+
+    Returns:
+        - (tuple): the file's dicom header, None if it is not a dicom file, and its path.
+    """
+    try:
+        return utils.get_dicom_header(pydicom.read_file(file_path, stop_before_pixels=True)), file_path
+    except (InvalidDicomError, OSError):
+        return None, file_path
+
+
+def _read_serially(files_path: list, reader) -> list:
+    """
+    Reads the files one after the other.
+
+    Parameters:
+        - files_path (list): the files' paths.
+        - reader (callable): the function reading a file.
+
+    Returns:
+        - (list): the reader's results, in files_path's order.
+    """
+    return list(map(reader, files_path))
+
+
+class DicomIndex:
+    _SCHEMA_VERSION = 1
+
+    def __init__(self, dicom_path: str, index_path: str = None, max_size: int = 2 ** 28):
+        """
+        Initializes an instance of DicomIndex class.
+
+        Parameters:
+            - dicom_path (str): the dicom directory's path.
+            - index_path (str): the directory holding one SQLite index per dicom directory, paths.DICOM_INDEX_PATH
+              if None.
+            - max_size (int): the maximum size of the indexes' directory, in bytes; the least recently used indexes
+              are removed beyond it.
+        """
+        self._dicom_path = os.path.abspath(dicom_path)
+
+        index_path = paths.DICOM_INDEX_PATH if index_path is None else index_path
+        os.makedirs(index_path, exist_ok=True)
+        index_name = hashlib.sha256(self._dicom_path.encode()).hexdigest()
+        self._index_path = os.path.join(index_path, f"{index_name}.sqlite")
+
+        with self._connect() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] != self._SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS files")
+                connection.execute(f"PRAGMA user_version = {self._SCHEMA_VERSION}")
+
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "name TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, series_uid TEXT, modality TEXT, "
+                "instance_number INTEGER, position REAL, header TEXT)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS files_series ON files (series_uid, instance_number)")
+
+        # The modification time drives the LRU eviction
+        os.utime(self._index_path)
+        self._evict(index_path, max_size)
+
+    def update(self, read_files=None) -> int:
+        """
+        Reads the headers of the files added or modified since the last update, forgets the removed files.
+
+        Parameters:
+            - read_files (callable): reads a list of paths with a reader, returns the reader's results in order;
+              the files are read one after the other if None.
+
+        Returns:
+            - (int): the number of files read.
+        """
+        read_files = _read_serially if read_files is None else read_files
+        files_stat = {entry.name: entry.stat() for entry in os.scandir(self._dicom_path) if entry.is_file()}
+
+        with self._connect() as connection:
+            indexed = {
+                name: (size, mtime_ns)
+                for name, size, mtime_ns in connection.execute("SELECT name, size, mtime_ns FROM files")
+            }
+            changed = [
+                name for name, stat in files_stat.items() if indexed.get(name) != (stat.st_size, stat.st_mtime_ns)
+            ]
+            removed = [(name,) for name in indexed if name not in files_stat]
+
+            rows = list()
+            files_path = [os.path.join(self._dicom_path, name) for name in changed]
+            for name, (header, _) in zip(changed, read_files(files_path, reader=read_index_entry)):
+                # Non-dicom files are indexed too, so they are not read again
+                header = header or dict()
+                position = header.get("ImagePositionPatient")
+                rows.append((
+                    name, files_stat[name].st_size, files_stat[name].st_mtime_ns,
+                    header.get("SeriesInstanceUID"), header.get("Modality"), header.get("InstanceNumber"),
+                    None if position is None else float(position[2]), json.dumps(header)
+                ))
+
+            connection.executemany("DELETE FROM files WHERE name = ?", removed)
+            connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+        return len(changed)
+
+    def get_series(self) -> list:
+        """
+        Returns the indexed series.
+
+        Returns:
+            - (list): the series' UID, modality and number of files.
+        """
+        with self._connect() as connection:
+            return [
+                {"series_uid": series_uid, "modality": modality, "num_files": num_files}
+                for series_uid, modality, num_files in connection.execute(
+                    "SELECT series_uid, modality, COUNT(*) FROM files WHERE series_uid IS NOT NULL "
+                    "GROUP BY series_uid, modality ORDER BY series_uid"
+                )
+            ]
+
+    def select(self, series_uid: str = None, modality: str = None) -> list:
+        """
+        Returns the headers and paths of the series matching the UID and the modality.
+
+        Parameters:
+            - series_uid (str): the series' SeriesInstanceUID, any if None.
+            - modality (str): the series' Modality, any if None.
+
+        Returns:
+            - (list): the series' headers and paths, sorted by InstanceNumber.
+        """
+        series = [
+            s for s in self.get_series()
+            if (series_uid is None or s["series_uid"] == series_uid) and (modality is None or s["modality"] == modality)
+        ]
+        if len(series) == 0:
+            raise ValueError(f"No dicom series matches the series UID {series_uid} and the modality {modality}.")
+        if len(series) > 1:
+            choices = ", ".join(f"{s['series_uid']} ({s['modality']}, {s['num_files']} files)" for s in series)
+            raise ValueError(f"Several dicom series match, choose one by series UID or modality: {choices}.")
+
+        with self._connect() as connection:
+            return [
+                (json.loads(header), os.path.join(self._dicom_path, name))
+                for name, header in connection.execute(
+                    "SELECT name, header FROM files WHERE series_uid = ? ORDER BY instance_number",
+                    (series[0]["series_uid"],)
+                )
+            ]
+
+    def _evict(self, index_path: str, max_size: int):
+        """
+        Removes the least recently used indexes until the indexes' directory fits into its maximum size.
+
+        Parameters:
+            - index_path (str): the indexes' directory.
+            - max_size (int): the maximum size of the indexes' directory, in bytes.
+        """
+        entries = list()
+        for entry in os.scandir(index_path):
+            if entry.name.endswith(".sqlite") and entry.path != self._index_path:
+                with contextlib.suppress(FileNotFoundError):
+                    entries.append((entry.stat().st_mtime, entry.stat().st_size, entry.path))
+
+        total_size = os.path.getsize(self._index_path) + sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= max_size:
+                break
+
+            # Another process may have removed it meanwhile
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(entry_path)
+            total_size -= size
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """
+        Opens the index, commits on success and always closes it.
+
+        Returns:
+            - (sqlite3.Connection): the index's connection.
+        """
+        connection = sqlite3.connect(self._index_path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
@@ -7,6 +7,7 @@ Purpose:
 """
 
 # IMPORT: utils
+import os
 import copy
 import torch
 
@@ -18,16 +19,35 @@ import utils
 
 
 class FileLoader:
-    def __init__(self):
+    def __init__(self, zero_copy: bool = False):
         """
         Initializes an instance of FileLoader class.
+
+        Parameters:
+            - zero_copy (bool): whether the loaded tensor may share the decoded volume's buffer.
         """
         self._meta_data = dict()
+        self._zero_copy = zero_copy
+
+    @classmethod
+    def from_params(cls, params: dict):
+        """
+        Builds a loader from the inference parameters.
+
+        Parameters:
+            - params (dict): the inference parameters.
+
+        Returns:
+            - (FileLoader): the file loader.
+        """
+        return cls(zero_copy=params.get("zero_copy", False))
 
     def get_meta_data(self) -> dict:
         """
         Returns metadata.
 
+        The metadata only holds compact per-slice arrays and scalars, so copying it is cheap.
+
         Returns:
             - (dict): the file loader's metadata.
         """
@@ -51,6 +71,22 @@ class FileLoader:
         """
         return self._meta_data["spacing"]
 
+    def get_identity(self, file_path: str) -> str:
+        """
+        Returns the file's identity without loading its volume.
+
+        Parameters:
+            - file_path (str): the file's path.
+
+        Returns:
+            - (str): the sha256 hex digest of the file's content, or of the directory's files.
+        """
+        files_path = [file_path]
+        if os.path.isdir(file_path):
+            files_path = [os.path.join(file_path, f) for f in sorted(os.listdir(file_path))]
+
+        return utils.hash_files(filter(os.path.isfile, files_path))
+
     def load(self, file_path: str) -> torch.Tensor:
         """
         Loads file's volume.
@@ -61,7 +97,19 @@ class FileLoader:
         Returns:
             - (dict): the numpy file content as a tensor.
         """
-        return torch.unsqueeze(utils.numpy_to_tensor(self._load(file_path)), dim=0)
+        return torch.unsqueeze(utils.numpy_to_tensor(self._load(file_path), copy=not self._zero_copy), dim=0)
+
+    def load_slices(self, file_path: str):
+        """
+        Loads file's slices, sorted along the z-axis; subclasses may decode them only when accessed.
+
+        Parameters:
+            - file_path (str): the file's path.
+
+        Returns:
+            - (Sequence[np.ndarray]): the file's slices.
+        """
+        return self._load(file_path)
 
     def _load(self, file_path: str) -> np.ndarray:
         """
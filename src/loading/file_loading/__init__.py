@@ -1,2 +1,9 @@
-from .dicom_loading import DicomLoader
-from .nrrd_loading import NRRDLoader
+from src.lazy_exports import lazy_exports
+
+__all__, __getattr__, __dir__ = lazy_exports(__name__, {
+    "DicomLoader": ".dicom_loading",
+    "NRRDLoader": ".nrrd_loading",
+    "NumpyLoader": ".numpy_loading",
+    "NumpyCompressedLoader": ".numpy_loading",
+    "NIfTILoader": ".nifti_loading"
+})
@@ -6,40 +6,143 @@ Version: 1.1
 Purpose:
 """
 
+# IMPORT: utils
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
 # IMPORT: data processing
 import numpy as np
 import torch
 
 # IMPORT: data loading
-import SimpleITK as sitk
 import pydicom
 
 # IMPORT: project
 import utils
 
 from src.loading.file_loader import FileLoader
+from src.loading.dicom_index import DicomIndex
+
+
+def _read_dicom_pixels(file_path: str) -> np.ndarray:
+    """
+    Reads a dicom file and decodes its pixels.
+
+    Parameters:
+        - file_path (str): the dicom file's path.
+
+    Returns:
+        - (np.ndarray): the dicom file's decoded pixels, in their stored dtype.
+    """
+    return pydicom.read_file(file_path).pixel_array
+
+
+class DicomSlices:
+    def __init__(self, files_path: list):
+        """
+        Initializes an instance of DicomSlices class.
+
+        Parameters:
+            - files_path (list): the dicom files' paths, sorted by InstanceNumber.
+        """
+        self._files_path = files_path
+
+    def __len__(self) -> int:
+        """
+        Returns the number of slices.
+
+        Returns:
+            - (int): the number of slices.
+        """
+        return len(self._files_path)
+
+    def __getitem__(self, slice_idx: int) -> np.ndarray:
+        """
+        Reads and decodes a slice.
+
+        Parameters:
+            - slice_idx (int): the slice's index.
+
+        Returns:
+            - (np.ndarray): the slice's pixels.
+        """
+        return _read_dicom_pixels(self._files_path[slice_idx]).astype(np.float32)
 
 
 class DicomLoader(FileLoader):
-    def __init__(self):
+    _EXECUTORS = {"thread": ThreadPoolExecutor, "process": ProcessPoolExecutor}
+
+    def __init__(self, num_workers: int = 1, executor: str = "thread", series_uid: str = None, modality: str = None,
+                 zero_copy: bool = False, index_path: str = None):
         """
         Initializes an instance of DicomLoader class.
+
+        Parameters:
+            - num_workers (int): the number of workers reading and decoding the dicom files.
+            - executor (str): the kind of pool used when num_workers > 1 ("thread" or "process").
+            - series_uid (str): the SeriesInstanceUID of the series to load, when a directory holds several.
+            - modality (str): the Modality of the series to load, when a directory holds several.
+            - zero_copy (bool): whether the loaded tensor may share the decoded volume's buffer.
+            - index_path (str): the directory of the dicom headers' indexes, paths.DICOM_INDEX_PATH if None.
+        """
+        super(DicomLoader, self).__init__(zero_copy=zero_copy)
+
+        if executor not in self._EXECUTORS:
+            raise ValueError(f"Unknown executor: {executor}.")
+
+        self._num_workers = max(1, num_workers)
+        self._executor = executor
+
+        self._series_uid = series_uid
+        self._modality = modality
+        self._index_path = index_path
+
+    @classmethod
+    def from_params(cls, params: dict):
         """
-        super(DicomLoader, self).__init__()
-        self._reader = sitk.ImageSeriesReader()
+        Builds a loader from the inference parameters.
 
-    def get_files(self) -> dict:
+        Parameters:
+            - params (dict): the inference parameters.
+
+        Returns:
+            - (DicomLoader): the file loader.
         """
-        Returns loaded volume's dicom file.
+        return cls(
+            num_workers=params.get("num_workers", 1),
+            executor=params.get("loading_executor", "thread"),
+            series_uid=params.get("series_uid"),
+            modality=params.get("modality"),
+            zero_copy=params.get("zero_copy", False),
+            index_path=params.get("dicom_index_path")
+        )
+
+    def get_identity(self, file_path: str) -> str:
+        """
+        Returns the selected series' identity, read from the directory's index and the files' stats.
+
+        A series exported again under the same SeriesInstanceUID gets a new identity if any of its files changed.
+
+        Parameters:
+            - file_path (str): the dicom directory's path.
 
         Returns:
-            - (dict): the loaded volume's dicom file.
+            - (str): the series' SeriesInstanceUID and the sha256 hex digest of its files' names, sizes and
+              modification times.
         """
-        return self._meta_data["files"]
+        series = self._get_series(file_path)
+
+        digest = hashlib.sha256()
+        for _, slice_path in series:
+            stat = os.stat(slice_path)
+            digest.update(f"{os.path.basename(slice_path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+
+        return f"{series[0][0].get('SeriesInstanceUID')}:{digest.hexdigest()}"
 
     def _load(self, file_path: str) -> np.ndarray:
         """
-        Loads dicom directory's volume.
+        Loads dicom directory's volume: the headers are checked first, then every slice is decoded into its slot.
 
         Parameters:
             - file_path (str): the dicom directory's path.
@@ -47,63 +150,156 @@ class DicomLoader(FileLoader):
         Returns:
             - (np.ndarray): the dicom directory's content as a numpy ndarray.
         """
-        # Get dicom files path
-        files_path = self._get_dicom_files(file_path)
+        files_path = self._read_headers(file_path)
+        return self._decode_slices(files_path, self._meta_data["shape"])
 
-        # Load the input volume and sort by InstanceNumber
-        files = self._files_path_as_dict(files_path)
-        if not self._is_continuous(files):
-            raise ValueError("Il manque des coupes dans le scanner.")
+    def load_slices(self, file_path: str) -> DicomSlices:
+        """
+        Reads dicom directory's headers only, the slices are decoded when accessed.
 
-        volume = np.asarray([
-            files[i].pixel_array for i in sorted(files.keys())
-        ], dtype=np.float32)
+        Parameters:
+            - file_path (str): the dicom directory's path.
+
+        Returns:
+            - (DicomSlices): the dicom directory's slices, sorted by InstanceNumber.
+        """
+        return DicomSlices(self._read_headers(file_path))
+
+    def _read_headers(self, file_path: str) -> list:
+        """
+        Sorts and checks the series from its headers only, so a broken series fails before any pixel is decoded.
+
+        Parameters:
+            - file_path (str): the dicom directory's path.
+
+        Returns:
+            - (list): the dicom files' paths, sorted by InstanceNumber.
+        """
+        # Read the indexed headers and sort by InstanceNumber
+        files = self._get_series(file_path)
+        headers, paths = self._files_path_as_dict(files)
+        self._check_series(headers, len(files))
+
+        slices_idx = sorted(headers.keys())
+        shape = (len(slices_idx), int(files[0][0].get("Rows")), int(files[0][0].get("Columns")))
 
         # Store the meta data
-        self._meta_data["files"] = files
-        self._meta_data["shape"] = volume.shape
-        self._meta_data["spacing"] = utils.get_dicom_spacing(files_path[0], files_path[1])
-        self._meta_data["position"] = utils.get_dicom_field(files_path[0], "PatientPosition")
+        self._store_meta_data(files, headers, slices_idx, shape)
+
+        return [paths[i] for i in slices_idx]
+
+    def _decode_slices(self, files_path: list, shape: tuple) -> np.ndarray:
+        """
+        Decodes the slices straight into a preallocated volume.
+
+        Parameters:
+            - files_path (list): the dicom files' paths, sorted by InstanceNumber.
+            - shape (tuple): the volume's shape.
+
+        Returns:
+            - (np.ndarray): the volume.
+        """
+        volume = np.empty(shape, dtype=np.float32)
+
+        if self._executor == "process" and self._num_workers > 1:
+            # Worker processes cannot write into this buffer, their slices are copied into their slots
+            for slice_idx, pixels in enumerate(self._read_files(files_path)):
+                volume[slice_idx] = pixels
+        else:
+            def decode_slice(slice_idx: int):
+                volume[slice_idx] = _read_dicom_pixels(files_path[slice_idx])
+
+            self._read_files(range(len(files_path)), reader=decode_slice)
 
         return volume
 
-    def _get_dicom_files(self, path) -> sitk.ImageSeriesReader_GetGDCMSeriesFileNames:
+    def _store_meta_data(self, files: list, headers: dict, slices_idx: list, shape: tuple):
+        """
+        Stores the metadata read from the dicom headers.
+
+        Parameters:
+            - files (list): the dicom files' headers and values, in files_path's order.
+            - headers (dict): a dictionary with InstanceNumber as key and dicom header as value.
+            - slices_idx (list): the sorted slices' indexes.
+            - shape (tuple): the volume's shape.
+        """
+        self._meta_data["shape"] = shape
+        self._meta_data["spacing"] = utils.get_header_spacing(files[0][0], files[1][0])
+        self._meta_data["position"] = files[0][0].get("PatientPosition")
+        self._meta_data["series_uid"] = files[0][0].get("SeriesInstanceUID")
+        self._meta_data["rescale_slope"] = self._get_slices_field(headers, slices_idx, "RescaleSlope", 1.)
+        self._meta_data["rescale_intercept"] = self._get_slices_field(headers, slices_idx, "RescaleIntercept", 0.)
+
+    def _get_series(self, path: str) -> list:
         """
-        Returns the dicom files' paths.
+        Returns the selected series' headers and paths, only the files changed since the last call are read.
 
         Parameters:
             - path (str): the dicom directory's path.
 
         Returns:
-            - (sitk.ImageSeriesReader_GetGDCMSeriesFileNames): the dicom files' paths.
+            - (list): the series' headers and paths, sorted by InstanceNumber.
+        """
+        index = DicomIndex(path, index_path=self._index_path)
+        index.update(read_files=self._read_files)
+
+        return index.select(series_uid=self._series_uid, modality=self._modality)
+
+    def _read_files(self, files_path: list, reader=_read_dicom_pixels) -> list:
+        """
+        Reads the dicom files, in parallel if several workers are set.
+
+        Parameters:
+            - files_path (list): the dicom files' paths.
+            - reader (callable): the function reading a file.
+
+        Returns:
+            - (list): the reader's results, in files_path's order.
         """
-        dicom_serie = self._reader.GetGDCMSeriesIDs(path)
-        if len(dicom_serie) > 1:
-            raise ValueError("Too much series in the repertory.")
+        if self._num_workers == 1 or len(files_path) < 2:
+            return list(map(reader, files_path))
 
-        return self._reader.GetGDCMSeriesFileNames(path, dicom_serie[0])
+        chunk_size = max(1, len(files_path) // (4 * self._num_workers))
+        with self._EXECUTORS[self._executor](max_workers=self._num_workers) as executor:
+            return list(executor.map(reader, files_path, chunksize=chunk_size))
 
     @staticmethod
-    def _files_path_as_dict(files_path: sitk.ImageSeriesReader_GetGDCMSeriesFileNames):
+    def _files_path_as_dict(files: list) -> tuple:
         """
-        Returns a dictionary with InstanceNumber as key and dicom file as value.
+        Returns dictionaries with InstanceNumber as key and dicom header or value as value.
 
         Parameters:
-            - files_path (sitk.ImageSeriesReader_GetGDCMSeriesFileNames): the dicom files' paths.
+            - files (list): the dicom files' headers and values (paths).
 
         Returns:
-            - (dict): a dictionary with InstanceNumber as key and dicom file as value.
+            - (dict): a dictionary with InstanceNumber as key and dicom header as value.
+            - (dict): a dictionary with InstanceNumber as key and the file's value as value.
         """
-        tmp_files = dict(map(
-            lambda f: (f.get("InstanceNumber") - 1, f),
-            map(lambda f: pydicom.read_file(f), files_path)
-        ))
+        tmp_files = {f.get("InstanceNumber") - 1: (f, value) for f, value in files}
 
         first_idx = min(tmp_files.keys())
-        if first_idx == 0:
-            return tmp_files
+        return (
+            {slice_idx - first_idx: f for slice_idx, (f, _) in tmp_files.items()},
+            {slice_idx - first_idx: value for slice_idx, (_, value) in tmp_files.items()}
+        )
+
+    @staticmethod
+    def _get_slices_field(headers: dict, slices_idx: list, field: str, default: float) -> np.ndarray:
+        """
+        Returns a numeric dicom field for every slice.
 
-        return {slice_idx-first_idx: file for slice_idx, file in tmp_files.items()}
+        Parameters:
+            - headers (dict): a dictionary with InstanceNumber as key and dicom header as value.
+            - slices_idx (list): the sorted slices' indexes.
+            - field (str): the dicom field.
+            - default (float): the value used when the field is missing.
+
+        Returns:
+            - (np.ndarray): the field's value for every slice.
+        """
+        return np.asarray([
+            default if headers[i].get(field) is None else float(headers[i].get(field)) for i in slices_idx
+        ], dtype=np.float32)
 
     @staticmethod
     def _is_continuous(files_dict: dict):
@@ -111,12 +307,43 @@ class DicomLoader(FileLoader):
         Verifies if dictionary's keys are continuous or not.
 
         Parameters:
-            - files_dict (dict): a dictionary with InstanceNumber as key and dicom file as value.
+            - files_dict (dict): a dictionary with InstanceNumber as key and dicom header as value.
 
         Returns:
             - (dict): True if continuous else False.
         """
+        # The keys start at 0, a missing slice leaves a gap below the maximum
         slices_idx = set(files_dict.keys())
-        expected_slices_idx = set(range(max(files_dict.keys()) + 1))
+        return slices_idx == set(range(len(slices_idx)))
+
+    @classmethod
+    def _check_series(cls, headers: dict, num_files: int):
+        """
+        Verifies the series has at least 2 slices, no missing or duplicated slice, a single matrix and a constant
+        slice spacing.
+
+        Parameters:
+            - headers (dict): a dictionary with InstanceNumber as key and dicom header as value.
+            - num_files (int): the number of files in the series.
+        """
+        # The z spacing is the gap between two slices
+        if num_files < 2:
+            raise ValueError(f"La série ne contient que {num_files} coupe(s), il en faut au moins 2.")
+        if len(headers) != num_files:
+            raise ValueError("Plusieurs coupes ont le même InstanceNumber.")
+        if not cls._is_continuous(headers):
+            raise ValueError("Il manque des coupes dans le scanner.")
+
+        slices_idx = sorted(headers.keys())
+        matrices = {
+            (headers[i].get("Rows"), headers[i].get("Columns"), tuple(headers[i].get("PixelSpacing") or ()))
+            for i in slices_idx
+        }
+        if len(matrices) > 1:
+            raise ValueError("Les coupes n'ont pas toutes la même matrice.")
 
-        return len(slices_idx.difference(expected_slices_idx)) == 0
+        positions = [headers[i].get("ImagePositionPatient") for i in slices_idx]
+        if len(positions) > 2 and None not in positions:
+            gaps = np.abs(np.diff([float(position[2]) for position in positions]))
+            if gaps.min() == 0 or gaps.max() - gaps.min() > 1e-2 * gaps.max():
+                raise ValueError("L'espacement entre les coupes n'est pas constant.")
@@ -0,0 +1,60 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose:
+"""
+
+# IMPORT: data processing
+import numpy as np
+
+from src.loading.file_loader import FileLoader
+
+
+class NIfTILoader(FileLoader):
+    def __init__(self, zero_copy: bool = False):
+        """
+        Initializes an instance of NIfTILoader class.
+
+        Parameters:
+            - zero_copy (bool): whether the loaded tensor may share the decoded volume.
+        """
+        super(NIfTILoader, self).__init__(zero_copy=zero_copy)
+
+    def _load(self, file_path):
+        """
+        Loads file's volume, uncompressed files are memory-mapped by nibabel.
+
+        Parameters:
+            - file_path (str): the file's path.
+
+        Returns:
+            - (np.ndarray): the file content as a numpy ndarray.
+        """
+        # nibabel is optional, only NIfTI inputs need it
+        try:
+            import nibabel
+        except ImportError:
+            raise ImportError("NIfTI inputs need nibabel: pip install nibabel.")
+
+        # The data object applies the header's scaling, the volume is in real intensities
+        image = nibabel.load(file_path)
+        volume = np.asanyarray(image.dataobj)
+        while volume.ndim > 3 and volume.shape[-1] == 1:
+            volume = volume[..., 0]
+        if volume.ndim != 3:
+            raise ValueError(f"A NIfTI volume must have 3 dimensions: {volume.shape}.")
+
+        # The voxels are stored (x, y, z) as in NRRD files, the tensor's single copy applies the rotation
+        volume = np.rot90(volume, k=1, axes=(0, 2))
+
+        zooms = image.header.get_zooms()
+        self._meta_data["shape"] = volume.shape
+        self._meta_data["spacing"] = (float(zooms[2]), float(zooms[1]), float(zooms[0]))
+        self._meta_data["position"] = "HFS"
+        self._meta_data["series_uid"] = None
+        self._meta_data["rescale_slope"] = np.ones(volume.shape[0], dtype=np.float32)
+        self._meta_data["rescale_intercept"] = np.zeros(volume.shape[0], dtype=np.float32)
+
+        return volume
@@ -6,6 +6,9 @@ Version: 1.1
 Purpose:
 """
 
+# IMPORT: utils
+import os
+
 # IMPORT: data loading
 import nrrd
 
@@ -13,15 +16,31 @@ import nrrd
 import numpy as np
 
 # IMPORT: project
+import utils
+
 from src.loading.file_loader import FileLoader
 
+# CONSTANTS: the NRRD types memory-mapped, the others are read by pynrrd
+_NRRD_TYPES = {
+    "float": "f4", "double": "f8",
+    "uchar": "u1", "unsigned char": "u1", "uint8": "u1", "uint8_t": "u1",
+    "signed char": "i1", "int8": "i1", "int8_t": "i1",
+    "short": "i2", "signed short": "i2", "int16": "i2", "int16_t": "i2",
+    "ushort": "u2", "unsigned short": "u2", "uint16": "u2", "uint16_t": "u2",
+    "int": "i4", "signed int": "i4", "int32": "i4", "int32_t": "i4",
+    "uint": "u4", "unsigned int": "u4", "uint32": "u4", "uint32_t": "u4"
+}
+
 
 class NRRDLoader(FileLoader):
-    def __init__(self):
+    def __init__(self, zero_copy: bool = False):
         """
         Initializes an instance of NRRDLoader class.
+
+        Parameters:
+            - zero_copy (bool): whether to keep the axis adjustment as a view, applied by the tensor's single copy.
         """
-        super(NRRDLoader, self).__init__()
+        super(NRRDLoader, self).__init__(zero_copy=zero_copy)
 
     def _load(self, file_path):
         """
@@ -33,17 +52,47 @@ class NRRDLoader(FileLoader):
         Returns:
             - (np.ndarray): the file content as a numpy ndarray.
         """
-        # Load the input volume
-        volume, header = nrrd.read(file_path)
+        volume = self.load_slices(file_path)
+        if self._zero_copy:
+            return volume
+
+        utils.count_volume_copy("nrrd_adjust_axis")
+        return volume.copy()
+
+    def load_slices(self, file_path: str):
+        """
+        Loads file's slices as a view of the memory-mapped raw data, a slice is only read when accessed; encoded
+        data is decoded by pynrrd at once.
+
+        Parameters:
+            - file_path (str): the file's path.
+
+        Returns:
+            - (np.ndarray): the file content as a numpy ndarray, sorted along the z-axis.
+        """
+        # Load the input volume, raw data is memory-mapped instead of read
+        header = nrrd.read_header(file_path)
+        volume = self._map_raw_data(file_path, header)
+        if volume is None:
+            volume, header = nrrd.read(file_path)
 
-        # Store the meta data
-        shape = header["sizes"]
-        self._meta_data["shape"] = (shape[0], shape[1], shape[2])
+        # NRRD volumes are stored in real intensities and in HFS position
+        volume = self._adjust_axis(volume)
+
+        # Store the meta data, in the adjusted volume's axis order
+        self._meta_data["shape"] = volume.shape
 
         spacing = header["space directions"]
-        self._meta_data["spacing"] = (spacing[2][2], spacing[0][0], spacing[1][1])
+        self._meta_data["spacing"] = (spacing[2][2], spacing[1][1], spacing[0][0])
+        self._meta_data["position"] = "HFS"
+        self._meta_data["series_uid"] = None
+        self._meta_data["nrrd_header"] = {
+            field: header[field] for field in ("space", "space directions", "space origin") if field in header
+        }
+        self._meta_data["rescale_slope"] = np.ones(volume.shape[0], dtype=np.float32)
+        self._meta_data["rescale_intercept"] = np.zeros(volume.shape[0], dtype=np.float32)
 
-        return self._adjust_axis(volume)
+        return volume
 
     @staticmethod
     def _adjust_axis(volume):
@@ -54,6 +103,60 @@ class NRRDLoader(FileLoader):
             - volume (np.ndarray): the volume to adjust axis.
 
         Returns:
-            - (np.ndarray): the adjusted volume.
+            - (np.ndarray): the adjusted volume, a view: each slice is contiguous in the file.
+        """
+        return np.rot90(volume, k=1, axes=(0, 2))
+
+    @staticmethod
+    def _map_raw_data(file_path, header):
+        """
+        Memory-maps a raw NRRD's data, copy-on-write so the file is never modified.
+
+        Parameters:
+            - file_path (str): the file's path.
+            - header (dict): the file's header.
+
+        Returns:
+            - (np.memmap): the file's data, None if its encoding, type or layout needs pynrrd.
+        """
+        dtype = _NRRD_TYPES.get(header.get("type"))
+        byte_skip = int(header.get("byte skip", 0))
+        if header.get("encoding") != "raw" or dtype is None or "line skip" in header or byte_skip < 0:
+            return None
+
+        # The data is either in a detached file or after the header's blank line
+        data_file = header.get("data file", header.get("datafile"))
+        if data_file is not None:
+            if data_file.startswith("LIST") or " " in data_file:
+                return None
+            data_path, offset = os.path.join(os.path.dirname(file_path), data_file), 0
+        else:
+            data_path, offset = file_path, NRRDLoader._get_data_offset(file_path)
+            if offset is None:
+                return None
+
+        dtype = np.dtype(dtype).newbyteorder("<" if header.get("endian", "little") == "little" else ">")
+        return np.memmap(
+            data_path, dtype=dtype, mode="c", offset=offset + byte_skip, shape=tuple(header["sizes"]), order="F"
+        )
+
+    @staticmethod
+    def _get_data_offset(file_path, chunk_size=2 ** 16):
+        """
+        Returns the position of the data attached after the header.
+
+        Parameters:
+            - file_path (str): the file's path.
+            - chunk_size (int): the number of bytes read at once.
+
+        Returns:
+            - (int): the data's first byte, None if the header has no end.
         """
-        return np.rot90(volume, k=1, axes=(0, 2)).copy()
+        content = b""
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(chunk_size), b""):
+                content += chunk
+                end = content.find(b"\n\n")
+                if end >= 0:
+                    return end + 2
+        return None
@@ -0,0 +1,100 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose:
+"""
+
+# IMPORT: utils
+import os
+import json
+
+# IMPORT: data processing
+import numpy as np
+
+# IMPORT: project
+import utils
+
+from src.loading.file_loader import FileLoader
+
+
+class NumpyLoader(FileLoader):
+    # Numpy files have no geometry, it is read from a "<name>.json" sidecar or defaults to the model's grid
+    _DEFAULT_SPACING = (2., 1.5234375, 1.5234375)
+
+    def __init__(self, zero_copy: bool = False):
+        """
+        Initializes an instance of NumpyLoader class.
+
+        Parameters:
+            - zero_copy (bool): whether the loaded tensor may share the memory-mapped volume.
+        """
+        super(NumpyLoader, self).__init__(zero_copy=zero_copy)
+
+    def _load(self, file_path):
+        """
+        Loads file's volume, memory-mapped copy-on-write so the file is never modified.
+
+        Parameters:
+            - file_path (str): the file's path.
+
+        Returns:
+            - (np.ndarray): the file content as a numpy ndarray.
+        """
+        return self._store_meta_data(file_path, np.load(file_path, mmap_mode="c"))
+
+    def _store_meta_data(self, file_path, volume):
+        """
+        Stores the volume's metadata, from the file's sidecar if any.
+
+        Parameters:
+            - file_path (str): the file's path.
+            - volume (np.ndarray): the file's volume, (z, x, y) with optional leading single axes.
+
+        Returns:
+            - (np.ndarray): the volume, as a (z, x, y) view.
+        """
+        while volume.ndim > 3 and volume.shape[0] == 1:
+            volume = volume[0]
+        if volume.ndim != 3:
+            raise ValueError(f"A numpy volume must have 3 dimensions: {volume.shape}.")
+
+        sidecar = dict()
+        sidecar_path = f"{os.path.splitext(file_path)[0]}.json"
+        if os.path.isfile(sidecar_path):
+            with open(sidecar_path) as sidecar_file:
+                sidecar = json.load(sidecar_file)
+
+        # Numpy volumes are stored in real intensities
+        self._meta_data["shape"] = volume.shape
+        self._meta_data["spacing"] = tuple(sidecar.get("spacing", self._DEFAULT_SPACING))
+        self._meta_data["position"] = sidecar.get("position", "HFS")
+        self._meta_data["series_uid"] = None
+        self._meta_data["rescale_slope"] = np.ones(volume.shape[0], dtype=np.float32)
+        self._meta_data["rescale_intercept"] = np.zeros(volume.shape[0], dtype=np.float32)
+
+        return volume
+
+
+class NumpyCompressedLoader(NumpyLoader):
+    def __init__(self, zero_copy: bool = False):
+        """
+        Initializes an instance of NumpyCompressedLoader class.
+
+        Parameters:
+            - zero_copy (bool): whether the loaded tensor may share the decompressed volume.
+        """
+        super(NumpyCompressedLoader, self).__init__(zero_copy=zero_copy)
+
+    def _load(self, file_path):
+        """
+        Loads file's volume, saved by utils.save_numpy_compressed.
+
+        Parameters:
+            - file_path (str): the file's path.
+
+        Returns:
+            - (np.ndarray): the file content as a numpy ndarray.
+        """
+        return self._store_meta_data(file_path, utils.load_numpy_compressed(file_path).numpy())
@@ -0,0 +1,147 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Registers the file loaders and detects an input's file type from its content.
+"""
+
+# IMPORT: utils
+import os
+import gzip
+import zlib
+import zipfile
+import importlib
+
+# The loaders' modules are only imported when a loader is built, detection reads a few bytes
+_LOADERS = dict()
+_DETECTORS = list()
+
+
+def register_loader(file_type: str, module: str, class_name: str, detector=None):
+    """
+    Registers a file loader.
+
+    Parameters:
+        - file_type (str): the file type's name.
+        - module (str): the loader's module, imported when the loader is built.
+        - class_name (str): the loader's class, a FileLoader.
+        - detector (callable): returns whether a path holds this file type, the file type is never detected if None.
+    """
+    _LOADERS[file_type] = (module, class_name)
+    if detector is not None:
+        _DETECTORS.append((file_type, detector))
+
+
+def get_file_types() -> list:
+    """
+    Returns the registered file types.
+
+    Returns:
+        - (list): the file types' names, in registration order.
+    """
+    return list(_LOADERS)
+
+
+def detect_file_type(file_path: str) -> str:
+    """
+    Detects a file type from the path's content, the detectors are tried in registration order.
+
+    Parameters:
+        - file_path (str): the input file path.
+
+    Returns:
+        - (str): the file type's name.
+    """
+    for file_type, detector in _DETECTORS:
+        if detector(file_path):
+            return file_type
+
+    raise ValueError(f"Unknown file format, expected one of {', '.join(get_file_types())}: {file_path}.")
+
+
+def build_loader(file_type: str, params: dict):
+    """
+    Builds the loader of a file type.
+
+    Parameters:
+        - file_type (str): the file type's name.
+        - params (dict): the inference parameters.
+
+    Returns:
+        - (FileLoader): the file loader.
+    """
+    if file_type not in _LOADERS:
+        raise ValueError(f"Unknown file type: {file_type}.")
+
+    module, class_name = _LOADERS[file_type]
+    return getattr(importlib.import_module(module), class_name).from_params(params)
+
+
+def _read_bytes(file_path: str, size: int, offset: int = 0) -> bytes:
+    """
+    Reads the first bytes of a file.
+
+    Parameters:
+        - file_path (str): the file's path.
+        - size (int): the number of bytes to read.
+        - offset (int): the first byte's position.
+
+    Returns:
+        - (bytes): the bytes read, empty if the path is not a file.
+    """
+    if not os.path.isfile(file_path):
+        return b""
+
+    with open(file_path, "rb") as file:
+        file.seek(offset)
+        return file.read(size)
+
+
+def _is_dicom_directory(path: str) -> bool:
+    # A dicom directory holds at least one file with the "DICM" preamble, it is usually the first one
+    if not os.path.isdir(path):
+        return False
+
+    with os.scandir(path) as entries:
+        return any(_read_bytes(entry.path, 4, offset=128) == b"DICM" for entry in entries if entry.is_file())
+
+
+def _is_nrrd(file_path: str) -> bool:
+    return _read_bytes(file_path, 4) == b"NRRD"
+
+
+def _is_numpy(file_path: str) -> bool:
+    return _read_bytes(file_path, 6) == b"\x93NUMPY"
+
+
+def _is_numpy_compressed(file_path: str) -> bool:
+    # Any zip archive starts with "PK", utils.save_numpy_compressed's ones hold the shape, dtype and compressed data
+    if _read_bytes(file_path, 4) != b"PK\x03\x04":
+        return False
+
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            return {"shape.npy", "dtype.npy", "data.npy"} <= set(archive.namelist())
+    except zipfile.BadZipFile:
+        return False
+
+
+def _is_nifti(file_path: str) -> bool:
+    # The single-file NIfTI magic is at byte 344, gzipped files are checked once decompressed
+    if _read_bytes(file_path, 2) == b"\x1f\x8b":
+        try:
+            with gzip.open(file_path, "rb") as file:
+                return file.read(348)[344:] == b"n+1\x00"
+        except (OSError, EOFError, zlib.error):
+            # A truncated or corrupted archive is not a NIfTI file
+            return False
+
+    return _read_bytes(file_path, 4, offset=344) == b"n+1\x00"
+
+
+register_loader("dicom", "src.loading.file_loading.dicom_loading", "DicomLoader", _is_dicom_directory)
+register_loader("nrrd", "src.loading.file_loading.nrrd_loading", "NRRDLoader", _is_nrrd)
+register_loader("npy", "src.loading.file_loading.numpy_loading", "NumpyLoader", _is_numpy)
+register_loader("npz", "src.loading.file_loading.numpy_loading", "NumpyCompressedLoader", _is_numpy_compressed)
+register_loader("nifti", "src.loading.file_loading.nifti_loading", "NIfTILoader", _is_nifti)
@@ -1 +1,2 @@
 from .swin_unetr import SwinUNETR
+from .model_loading import load_model
@@ -0,0 +1,100 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Loads the model, eagerly, memory-mapped or from a cached TorchScript artifact.
+"""
+
+# IMPORT: utils
+import os
+import json
+
+# IMPORT: deep learning
+import torch
+
+# IMPORT: project
+import utils
+
+from .swin_unetr import SwinUNETR
+
+
+def get_script_path(weights_path: str, in_channels: int, plane_size: int = 512) -> str:
+    """
+    Returns the path of the TorchScript artifact cached next to the weights.
+
+    Parameters:
+        - weights_path (str): the model weights' path.
+        - in_channels (int): the number of in channels.
+        - plane_size (int): the in-plane size the model is traced for.
+
+    Returns:
+        - (str): the TorchScript artifact's path.
+    """
+    return f"{os.path.splitext(weights_path)[0]}_{in_channels}c_{plane_size}px.torchscript.pt"
+
+
+def get_weights_signature(weights_path: str) -> dict:
+    """
+    Returns the weights' signature stored in their TorchScript artifact.
+
+    Parameters:
+        - weights_path (str): the model weights' path.
+
+    Returns:
+        - (dict): the weights' size, modification time and sha256 hex digest.
+    """
+    stat = os.stat(weights_path)
+    return {
+        "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+        "sha256": utils.hash_files([weights_path])
+    }
+
+
+def load_model(weights_path: str, in_channels: int = 1, mode: str = "eager", plane_size: int = 512) -> torch.nn.Module:
+    """
+    Loads the model.
+
+    Parameters:
+        - weights_path (str): the model weights' path, a randomly initialized model if None.
+        - in_channels (int): the number of in channels.
+        - mode (str): "eager" to copy the weights, "mmap" to memory-map them,
+          "torchscript" to load the serialized model, created once from the weights.
+        - plane_size (int): the in-plane size of every input in "torchscript" mode, the traced model is only valid
+          for this size since SwinUNETR's padding and window masks depend on it.
+
+    Returns:
+        - (torch.nn.Module): the loaded model.
+    """
+    if mode == "eager":
+        return SwinUNETR(weights_path=weights_path, in_channels=in_channels)
+    if mode == "mmap":
+        return SwinUNETR(weights_path=weights_path, in_channels=in_channels, mmap=True)
+    if mode != "torchscript":
+        raise ValueError(f"Unknown model loading mode: {mode}.")
+    if weights_path is None:
+        raise ValueError("TorchScript loading needs a weights file.")
+
+    # The artifact is stale once the weights' content changed, a weights file only touched keeps it
+    script_path = get_script_path(weights_path, in_channels, plane_size)
+    if os.path.exists(script_path):
+        extra_files = {"weights.json": ""}
+        script = torch.jit.load(script_path, map_location="cpu", _extra_files=extra_files)
+        stored = json.loads(extra_files["weights.json"] or "{}")
+
+        stat = os.stat(weights_path)
+        if stored.get("size") == stat.st_size and (
+                stored.get("mtime_ns") == stat.st_mtime_ns or stored.get("sha256") == utils.hash_files([weights_path])
+        ):
+            return script
+
+    model = SwinUNETR(weights_path=weights_path, in_channels=in_channels, mmap=True).eval()
+    with torch.no_grad():
+        script = torch.jit.trace(model, torch.zeros((1, in_channels, plane_size, plane_size)))
+
+    # Written under a temporary name so concurrent workers never load a partial artifact
+    tmp_path = f"{script_path}.{os.getpid()}.tmp"
+    torch.jit.save(script, tmp_path, _extra_files={"weights.json": json.dumps(get_weights_signature(weights_path))})
+    os.replace(tmp_path, script_path)
+
+    return script
@@ -14,13 +14,14 @@ from monai.networks.nets import SwinUNETR as monai_SwinUNETR
 class SwinUNETR(monai_SwinUNETR):
     _DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-    def __init__(self, weights_path: str = None, in_channels: int = 1):
+    def __init__(self, weights_path: str = None, in_channels: int = 1, mmap: bool = False):
         """
         Initializes an instance of SwinUNETR class.
 
         Parameters:
             - weights_path (str): the model weights' path to load.
             - in_channels (int): the number of in channels.
+            - mmap (bool): whether to memory-map the weights instead of copying them into the parameters.
         """
         # Initialise the model
         super(SwinUNETR, self).__init__(img_size=(512, 512), spatial_dims=2,
@@ -30,5 +31,8 @@ class SwinUNETR(monai_SwinUNETR):
         self.name = "UNet_25D"
         self.weights_path = weights_path
 
-        if weights_path is not None:
+        if weights_path is not None and mmap:
+            # The parameters point to the file's pages, shared between processes loading the same weights
+            self.load_state_dict(torch.load(weights_path, map_location="cpu", mmap=True), assign=True)
+        elif weights_path is not None:
             self.load_state_dict(torch.load(weights_path))
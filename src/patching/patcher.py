@@ -6,6 +6,9 @@ Version: 1.1
 Purpose:
 """
 
+# IMPORT: utils
+from collections import deque
+
 # IMPORT: tensor
 import torch
 
@@ -14,14 +17,32 @@ import utils
 
 
 class Patcher:
-    def __init__(self, patch_height: int = 1):
+    def __init__(self, patch_height: int = 1, shared: bool = False):
         """
         Initializes an instance of Patcher class.
 
         Parameters:
             - patch_height (int): the patch's height.
+            - shared (bool): whether the aggregated volumes are allocated in shared memory, for the data parallel
+              workers.
         """
         self._patch_height = patch_height
+        self._shared = shared
+
+    def get_num_patches(self, depth: int) -> int:
+        """
+        Returns the number of patches of a volume.
+
+        Parameters:
+            - depth (int): the volume's number of slices.
+
+        Returns:
+            - (int): the number of patches.
+        """
+        if depth < self._patch_height:
+            raise ValueError(f"The volume has {depth} slice(s), patches need at least {self._patch_height}.")
+
+        return depth - self._patch_height + 1
 
     def generate_patches(self, volume):
         """
@@ -33,10 +54,95 @@ class Patcher:
         Returns:
             - (torch.Tensor): the generated patches.
         """
+        # Checked before squeezing, a single-slice volume would lose its z-axis
+        self.get_num_patches(volume.shape[-3])
         input_patches = torch.squeeze(volume)
         input_patches = input_patches.unfold(0, self._patch_height, 1)
         return torch.movedim(input_patches, 3, 1)
 
+    def iter_batches(self, slices, batch_size: int):
+        """
+        Forms patches on the fly from a stream of slices and groups them into batches.
+
+        Parameters:
+            - slices (Iterator[torch.Tensor]): the slices to generate patches from.
+            - batch_size (int): the number of patches per batch.
+
+        Returns:
+            - (Iterator[tuple]): the index of the batch's first patch and the batch.
+        """
+        window = deque(maxlen=self._patch_height)
+        batch, start = list(), 0
+
+        for input_slice in slices:
+            window.append(input_slice)
+            if len(window) < self._patch_height:
+                continue
+
+            batch.append(torch.stack(tuple(window)))
+            if len(batch) == batch_size:
+                yield start, torch.stack(batch)
+                batch, start = list(), start + batch_size
+
+        if batch:
+            yield start, torch.stack(batch)
+
+    def allocate_volume(self, patches_shape, channels: int = 1):
+        """
+        Allocates the aggregated volume of the predicted patches, halo slices included.
+
+        Parameters:
+            - patches_shape (torch.Size): the shape of the patches to aggregate.
+            - channels (int): the number of predicted channels.
+
+        Returns:
+            - (torch.Tensor): the zero-filled aggregated volume.
+        """
+        return utils.allocate_tensor((
+            channels, patches_shape[0] + 2 * (self._patch_height // 2), patches_shape[-2], patches_shape[-1]
+        ), shared=self._shared)
+
+    def insert_patches(self, volume, patches, start: int):
+        """
+        Writes predicted patches into the aggregated volume at their final z-offset.
+
+        Parameters:
+            - volume (torch.Tensor): the aggregated volume.
+            - patches (torch.Tensor): the predicted patches.
+            - start (int): the index of the first patch.
+        """
+        start += self._patch_height // 2
+        volume[:, start: start + patches.shape[0]].copy_(torch.movedim(patches, 0, 1))
+
+    def scatter_patches(self, volume, patches, patches_idx):
+        """
+        Writes predicted patches into the aggregated volume at their final z-offsets.
+
+        Parameters:
+            - volume (torch.Tensor): the aggregated volume.
+            - patches (torch.Tensor): the predicted patches.
+            - patches_idx (torch.Tensor): the patches' indexes.
+        """
+        volume[:, patches_idx + self._patch_height // 2] = torch.movedim(patches, 0, 1)
+
+    def get_occupancy(self, patches, threshold: float):
+        """
+        Returns which patches contain an intensity above the threshold.
+
+        Parameters:
+            - patches (torch.Tensor): the generated patches.
+            - threshold (float): the intensity under which a patch is considered empty.
+
+        Returns:
+            - (torch.Tensor): True for every occupied patch.
+        """
+        if patches.shape[0] == 0:
+            return torch.zeros(0, dtype=torch.bool)
+
+        # Each slice's maximum is computed once, then shared by the patch_height patches containing it
+        slices_max = torch.cat((patches[:, 0].amax(dim=(1, 2)), patches[-1, 1:].amax(dim=(1, 2))))
+        return slices_max.unfold(0, self._patch_height, 1).amax(dim=1) >= threshold
+
     def aggregate_patches(self, patches):
         """
         Aggregates patches into a volume.
@@ -47,7 +153,7 @@ class Patcher:
         Returns:
             - (torch.Tensor): the aggregated volume.
         """
-        shape = list(patches.shape)
-        shape[1] = self._patch_height // 2
+        volume = self.allocate_volume(patches.shape[1:], channels=patches.shape[0])
+        volume[:, self._patch_height // 2: self._patch_height // 2 + patches.shape[1]] = patches
 
-        return torch.cat((torch.zeros(shape), patches, torch.zeros(shape)), dim=1)
+        return volume
@@ -0,0 +1,150 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Predicts several studies with overlapping stages.
+"""
+
+# IMPORT: utils
+import time
+import queue
+import threading
+
+# IMPORT: projet
+from .prediction import PredictionManagement
+
+
+class PipelineRunner:
+    _END = None
+
+    def __init__(self, params: dict, queue_size: int = 1):
+        """
+        Initializes an instance of PipelineRunner class.
+
+        Parameters:
+            - params (dict): the inference parameters.
+            - queue_size (int): the number of studies waiting between two stages, bounds the memory used.
+        """
+        # Streaming fuses the loading and the model stages, there is nothing left to overlap
+        if params.get("streaming", False):
+            raise ValueError("The pipeline does not support streaming, run the studies one by one instead.")
+
+        self._predictor = PredictionManagement(file_path=None, file_type="auto", params=params)
+        self._queue_size = queue_size
+
+    def launch(self, jobs: list) -> list:
+        """
+        Predicts the studies, loading study N+1 and saving study N-1 while study N is in the model.
+
+        Parameters:
+            - jobs (list): the studies to predict, [{"file": path, "file_type": "auto" | "dicom" | "nrrd" | ...}, ...];
+              the file type is detected from the file's content if missing, an invalid job gets an error result.
+
+        Returns:
+            - (list): the jobs' results, in jobs' order.
+        """
+        prepared = queue.Queue(maxsize=self._queue_size)
+        predicted = queue.Queue(maxsize=self._queue_size)
+        results = [dict() for _ in jobs]
+
+        preparer = threading.Thread(target=self._prepare, args=(jobs, prepared, results))
+        finalizer = threading.Thread(target=self._finalize, args=(jobs, predicted, results))
+        preparer.start()
+        finalizer.start()
+
+        # The model stage runs in the calling thread
+        try:
+            while (item := prepared.get()) is not self._END:
+                job_idx, input_patches, meta_data, cache_key = item
+                try:
+                    prediction = self._predictor.segment(input_patches, results[job_idx]["timings"])
+                    predicted.put((job_idx, prediction, meta_data, cache_key))
+                except Exception as error:
+                    self._fail(results[job_idx], error)
+        finally:
+            predicted.put(self._END)
+
+        preparer.join()
+        finalizer.join()
+
+        # A job is only done once its background write succeeded, a failed write fails its own job only
+        save_errors = dict(self._predictor.collect_saves())
+        for result in results:
+            error = save_errors.get(result.get("output_path"))
+            if result.get("status") == "done" and not result.get("cached") and error is not None:
+                result.update({"status": "error", "error": repr(error)})
+        self._predictor.save_metrics()
+
+        return results
+
+    def close(self):
+        """
+        Waits for the background saves and stops the predictor's workers.
+        """
+        self._predictor.close()
+
+    def _prepare(self, jobs: list, prepared: queue.Queue, results: list):
+        """
+        Loads, pre-processes and patches the studies.
+
+        Parameters:
+            - jobs (list): the studies to predict.
+            - prepared (queue.Queue): the prepared studies' queue.
+            - results (list): the jobs' results.
+        """
+        try:
+            for job_idx, job in enumerate(jobs):
+                results[job_idx].update({"timings": dict(), "start": time.time()})
+                try:
+                    results[job_idx]["file"] = job["file"]
+                    loader = self._predictor.build_loader(job.get("file_type", "auto"), job["file"])
+
+                    output_path, cache_key = self._predictor.fetch_cache(loader, job["file"])
+                    if output_path is not None:
+                        results[job_idx].update({"status": "done", "output_path": output_path, "cached": True})
+                        results[job_idx]["total"] = time.time() - results[job_idx].pop("start")
+                        continue
+
+                    input_patches, meta_data = self._predictor.prepare(
+                        loader, job["file"], results[job_idx]["timings"]
+                    )
+                    prepared.put((job_idx, input_patches, meta_data, cache_key))
+                except Exception as error:
+                    self._fail(results[job_idx], error)
+        finally:
+            # The model stage waits for this marker, it is sent even if the loop itself fails
+            prepared.put(self._END)
+
+    def _finalize(self, jobs: list, predicted: queue.Queue, results: list):
+        """
+        Post-processes and saves the predicted studies.
+
+        Parameters:
+            - jobs (list): the studies to predict.
+            - predicted (queue.Queue): the predicted studies' queue.
+            - results (list): the jobs' results.
+        """
+        while (item := predicted.get()) is not self._END:
+            job_idx, prediction, meta_data, cache_key = item
+            try:
+                output_path = self._predictor.finalize(
+                    prediction, meta_data, results[job_idx]["file"], results[job_idx]["timings"],
+                    on_saved=self._predictor.get_cache_callback(cache_key)
+                )
+                results[job_idx].update({"status": "done", "output_path": output_path, "cached": False})
+                results[job_idx]["total"] = time.time() - results[job_idx].pop("start")
+            except Exception as error:
+                self._fail(results[job_idx], error)
+
+    @staticmethod
+    def _fail(result: dict, error: Exception):
+        """
+        Marks a job as failed.
+
+        Parameters:
+            - result (dict): the job's result.
+            - error (Exception): the error raised by the job.
+        """
+        result.update({"status": "error", "error": repr(error)})
+        result["total"] = time.time() - result.pop("start", time.time())
@@ -7,10 +7,6 @@ Purpose: Computes the inference of a given model.
 """
 
 # IMPORT: utils
-import os
-import time
-
-import zstd
 from tqdm import tqdm
 
 # IMPORT: deep learning
@@ -18,11 +14,16 @@ import torch
 
 # IMPORT: projet
 import paths
+import utils
 
-from .loading import DicomLoader, NRRDLoader
+from . import loading, saving
 from .image_processing import PreProcessor, PostProcessor
 from .patching import Patcher
-from .models import SwinUNETR
+from .models import load_model
+from .caching import ResultCache
+from .profiling import Profiler
+from .inference import InferenceEngine, Autotuner, DataParallelPredictor, TiledEngine, compare_engines, load_tuning
+from .inference import export_onnx, load_onnx_engine
 
 
 class PredictionManagement:
@@ -44,68 +45,390 @@ class PredictionManagement:
         self._patch_height = 5
         self._batch_size = 16
 
-        self._model = SwinUNETR(
-            weights_path=paths.MODEL_PATH,
-            in_channels=self._patch_height
+        # Host's tuning for this configuration, see autotune
+        tuning = load_tuning(self._params)
+        if tuning is not None:
+            self._batch_size = tuning["batch_size"]
+            torch.set_num_threads(tuning["num_threads"])
+
+        # Weights, a randomly initialized model if None (benchmarks)
+        self._weights_path = self._params.get("weights_path", paths.MODEL_PATH)
+
+        # TorchScript and ONNX models are traced for a single plane size: the model grid's one, or the tiles' one
+        self._plane_size = self._params.get("tile_size", 512) if self._params.get("tiling", False) else 512
+
+        model_loading = self._params.get("model_loading", "eager")
+        if model_loading == "torchscript" and self._params.get("precision", "fp32") == "int8":
+            raise ValueError("The int8 precision needs an eager model, quantize_dynamic does not support TorchScript.")
+
+        # Skipping needs every patch up front: the workers split the whole volume and streaming never holds it
+        if self._params.get("skip_threshold") is not None and self._params.get("data_parallel", 1) > 1:
+            raise ValueError("The skip threshold is not supported with data parallel inference.")
+        if self._params.get("skip_threshold") is not None and self._params.get("streaming", False):
+            raise ValueError("The skip threshold is not supported with streaming inference.")
+        if self._params.get("streaming", False) and self._params.get("data_parallel", 1) > 1:
+            raise ValueError("Streaming inference is not supported with data parallel inference.")
+
+        # The int8 Linear weights are packed per process, the workers could not share them
+        if self._params.get("precision", "fp32") == "int8" and self._params.get("data_parallel", 1) > 1:
+            raise ValueError("The int8 precision is not supported with data parallel inference.")
+
+        self._model = load_model(
+            weights_path=self._weights_path,
+            in_channels=self._patch_height,
+            mode=model_loading,
+            plane_size=self._plane_size
         ).to(torch.device(self._DEVICE))
 
+        # Converted once, before the engines and the data parallel workers share the model
+        self._channels_last = self._params.get("channels_last", False) and self._DEVICE == "cpu"
+        if self._channels_last:
+            self._model = self._model.to(memory_format=torch.channels_last)
+
+        # Inference engine
+        self._engine = InferenceEngine(
+            self._model,
+            precision=self._params.get("precision", "fp32"),
+            channels_last=self._channels_last
+        )
+
+        if self._params.get("backend", "torch") == "onnx" and self._weights_path is None:
+            print("Modèle sans poids, pas d'export ONNX: inférence avec torch.")
+        elif self._params.get("backend", "torch") == "onnx":
+            onnx_engine = load_onnx_engine(self._weights_path, self._patch_height, self._plane_size)
+            if onnx_engine is None:
+                print("Export ONNX absent ou périmé (ou onnxruntime manquant), inférence avec torch.")
+            else:
+                self._engine = onnx_engine
+
+        # In-plane tiling, the planes are not cropped to 512x512
+        self._tiling = None
+        if self._params.get("tiling", False):
+            self._tiling = (self._params.get("tile_size", 512), self._params.get("tile_overlap", 0.25))
+            self._engine = self._build_tiled_engine(self._engine)
+
+        self._tolerance_checked = False
+        self._skipped_patches = 0
+
         # Loader
-        self._loader = DicomLoader() if file_type == "dicom" else NRRDLoader()
+        self._loader = self.build_loader(file_type, file_path)
+
+        # The data parallel workers read the patches and write the prediction in place, both live in shared memory
+        shared = self._params.get("data_parallel", 1) > 1
 
         # Pre-processor
-        self._pre_processor = PreProcessor()
+        self._pre_processor = PreProcessor(tile_size=None if self._tiling is None else self._tiling[0], shared=shared)
 
         # Patcher
-        self._patcher = Patcher(patch_height=self._patch_height)
+        self._patcher = Patcher(patch_height=self._patch_height, shared=shared)
 
         # Post-processor
         self._post_processor = PostProcessor(self._params)
 
-    def launch(self):
+        # Data parallel workers, they run the torch model at the current engine's precision
+        self._data_parallel = None
+        if self._params.get("data_parallel", 1) > 1:
+            if self._engine.precision == "onnx":
+                raise ValueError("Data parallel inference only supports the torch backend.")
+
+            self._data_parallel = DataParallelPredictor(
+                self._model, self._patcher,
+                num_workers=self._params["data_parallel"],
+                channels_last=self._channels_last,
+                tiling=self._tiling
+            )
+
+        # Profiler
+        self._profiler = Profiler(trace_path=self._params.get("trace_path"))
+
+        # Saver
+        self._saver = self._build_saver(self._params.get("output_format", "pt"), self._params.get("half", False))
+        self._pending_saves = list()
+
+        # Result cache, a randomly initialized model has no weights to key its results with
+        self._cache = None
+        if self._params.get("cache", False) and self._weights_path is None:
+            print("Cache désactivé: le modèle n'a pas de poids.")
+        elif self._params.get("cache", False):
+            self._cache = ResultCache(
+                paths.CACHE_PATH, self._weights_path, max_size=self._params.get("cache_size", 10 * 2 ** 30)
+            )
+
+    def autotune(self, memory_budget: int) -> dict:
+        """
+        Calibrates the batch size and the number of threads on this host, later runs use them.
+
+        Parameters:
+            - memory_budget (int): the maximum memory growth allowed during inference, in bytes.
+
+        Returns:
+            - (dict): the best configuration and every measure.
+        """
+        tuning = Autotuner(
+            self._engine, in_channels=self._patch_height, memory_budget=memory_budget, params=self._params
+        ).launch()
+
+        self._batch_size = tuning["batch_size"]
+        torch.set_num_threads(tuning["num_threads"])
+
+        return tuning
+
+    def report_engine(self, num_batches: int = 4) -> dict:
+        """
+        Compares the inference engine against the fp32 one on the current study's batches.
+
+        Parameters:
+            - num_batches (int): the number of batches compared, spread along the z-axis.
+
+        Returns:
+            - (dict): the errors and the speedup of every compared batch, and their worst and mean values.
+        """
+        input_patches, _ = self.prepare(self._loader, self._file_path, dict())
+
+        reference = self._build_reference_engine()
+        starts = torch.linspace(0, max(0, input_patches.shape[0] - self._batch_size), num_batches).long().unique()
+        batches = [
+            compare_engines(reference, self._engine, input_patches[start: start + self._batch_size])
+            for start in starts.tolist()
+        ]
+
+        return {
+            "precision": self._engine.precision,
+            "max_abs_error": max(b["max_abs_error"] for b in batches),
+            "mean_abs_error": sum(b["mean_abs_error"] for b in batches) / len(batches),
+            "speedup": sum(b["speedup"] for b in batches) / len(batches),
+            "batches": batches
+        }
+
+    def export_onnx(self) -> str:
+        """
+        Exports the model to ONNX next to its weights, used by the "onnx" backend.
+
+        Returns:
+            - (str): the ONNX export's path.
+        """
+        return export_onnx(self._model, self._weights_path, self._patch_height, self._plane_size)
+
+    def set_input(self, file_path: str, file_type: str):
+        """
+        Changes the input file while keeping the model resident.
+
+        Parameters:
+            - file_path (str): the input file path.
+            - file_type (str): the input file type.
+        """
+        self._file_path = file_path
+        self._loader = self.build_loader(file_type, file_path)
+
+    def launch(self) -> dict:
         """
         Launches inference process.
+
+        Returns:
+            - (dict): the output path, the stages' timings in seconds, the number of skipped patches
+              and whether the result came from the cache.
         """
+        timings = dict()
+        self._skipped_patches = 0
+        self._profiler.reset()
+
+        # Cached result
+        output_path, cache_key = self.fetch_cache(self._loader, self._file_path)
+        if output_path is not None:
+            return {"output_path": output_path, "timings": timings, "skipped_patches": 0, "cached": True}
+
         # Clear GPU cache
         torch.cuda.empty_cache()
 
-        # Loading
-        print("\nChargement des fichiers")
+        with self._profiler.trace():
+            if self._params.get("streaming", False):
+                prediction, meta_data = self.stream(self._loader, self._file_path, timings)
+            else:
+                input_patches, meta_data = self.prepare(self._loader, self._file_path, timings)
+                prediction = self.segment(input_patches, timings)
+            output_path = self.finalize(
+                prediction, meta_data, self._file_path, timings, on_saved=self.get_cache_callback(cache_key)
+            )
 
-        start = time.time()
-        input_volume = self._loader.load(self._file_path)
-        print(f"{round(time.time() - start, 3)} secondes.")
+        print(f"\nCopies complètes du volume: {sum(utils.get_volume_copies().values())}")
+        self.save_metrics()
 
-        # Pre-processing
-        print("\nPre-processing de l'examen TEP")
+        return {
+            "output_path": output_path, "timings": timings, "skipped_patches": self._skipped_patches, "cached": False
+        }
 
-        start = time.time()
-        input_volume = self._pre_processor.launch(input_volume, self._loader.get_meta_data())
-        print(f"{round(time.time() - start, 3)} secondes.")
+    def fetch_cache(self, loader, file_path: str) -> tuple:
+        """
+        Looks a study up in the result cache, its cached prediction is restored to the output path on a hit.
+
+        Parameters:
+            - loader (FileLoader): the loader matching the study's file type.
+            - file_path (str): the study's path.
+
+        Returns:
+            - (str): the restored output path, None if the study is not cached.
+            - (str): the study's cache key, None if the cache is disabled.
+        """
+        if self._cache is None:
+            return None, None
+
+        output_path = self._saver.get_output_path(file_path)
+        cache_key = self._cache.get_key(loader.get_identity(file_path), self._params)
+        if not self._cache.fetch(cache_key, output_path):
+            return None, cache_key
+
+        print("\nEstimation récupérée du cache")
+        return output_path, cache_key
+
+    def get_cache_callback(self, cache_key: str):
+        """
+        Returns the callback storing a saved prediction in the result cache.
+
+        Parameters:
+            - cache_key (str): the study's cache key, None if the cache is disabled.
+
+        Returns:
+            - (callable): called with the saved file's path, None if the cache is disabled.
+        """
+        if cache_key is None:
+            return None
+        return lambda path: self._cache.store(cache_key, path)
+
+    def prepare(self, loader, file_path: str, timings: dict) -> tuple:
+        """
+        Loads, pre-processes and patches a study.
+
+        Parameters:
+            - loader (FileLoader): the loader matching the study's file type.
+            - file_path (str): the study's path.
+            - timings (dict): the stages' timings to fill.
+
+        Returns:
+            - (torch.Tensor): the input patches.
+            - (dict): the study's metadata.
+        """
+        # Loading
+        with self._profiler.stage("loading", "Chargement des fichiers", timings):
+            input_volume = loader.load(file_path)
+            meta_data = loader.get_meta_data()
+
+        # Pre-processing
+        with self._profiler.stage("pre_processing", "Pre-processing de l'examen TEP", timings):
+            input_volume = self._pre_processor.launch(input_volume, meta_data)
 
         # Patching
-        print("\nFormatage des données en 2.5D")
+        with self._profiler.stage("patching", "Formatage des données en 2.5D", timings):
+            input_patches = self._patcher.generate_patches(input_volume)
+
+        return input_patches, meta_data
 
-        start = time.time()
-        input_patches = self._patcher.generate_patches(input_volume)
-        print(f"{round(time.time() - start, 3)} secondes.")
+    def segment(self, input_patches: torch.Tensor, timings: dict) -> torch.Tensor:
+        """
+        Predicts a study's noise.
+
+        Parameters:
+            - input_patches (torch.Tensor): the input patches.
+            - timings (dict): the stages' timings to fill.
 
+        Returns:
+            - (torch.Tensor): the predicted noise as a tensor.
+        """
         # Segmentation
-        print("\nEstimation du bruit")
+        with self._profiler.stage("segmentation", "Estimation du bruit", timings):
+            self._check_tolerance(input_patches)
+            prediction = self._predict_noise(input_patches)
 
-        start = time.time()
-        prediction = self._predict_noise(input_patches)
-        print(f"{round(time.time() - start, 3)} secondes.")
+        return prediction
 
-        # Post-processing
-        print("\nPost-processing de l'estimation")
+    def stream(self, loader, file_path: str, timings: dict) -> tuple:
+        """
+        Loads, pre-processes, patches and predicts a study slab by slab.
+
+        Parameters:
+            - loader (FileLoader): the loader matching the study's file type.
+            - file_path (str): the study's path.
+            - timings (dict): the stages' timings to fill.
+
+        Returns:
+            - (torch.Tensor): the predicted noise as a tensor.
+            - (dict): the study's metadata.
+        """
+        # Streaming segmentation
+        with self._profiler.stage("streaming", "Estimation du bruit en flux", timings):
+            slices = loader.load_slices(file_path)
+            meta_data = loader.get_meta_data()
+
+            depth = self._pre_processor.get_output_depth(len(slices), meta_data["spacing"][0])
+            plane_shape = self._pre_processor.get_output_plane_shape(meta_data["shape"][1:], meta_data["spacing"])
+            prediction = self._patcher.allocate_volume((self._patcher.get_num_patches(depth), *plane_shape))
+            for start_idx, slab in self.iter_noise_slabs(slices, meta_data):
+                self._patcher.insert_patches(prediction, slab, start_idx)
+
+        return prediction, meta_data
+
+    def iter_noise_slabs(self, slices, meta_data: dict):
+        """
+        Predicts noise while the slices are read; with lazily read slices (dicom, raw NRRD, numpy), the input's peak
+        memory depends on the batch size and not on the depth.
 
-        start = time.time()
-        prediction = self._post_processor.launch(prediction, self._loader.get_meta_data())
-        print(f"{round(time.time() - start, 3)} secondes.")
+        Parameters:
+            - slices (Sequence[np.ndarray]): the study's slices, sorted along the z-axis.
+            - meta_data (dict): the study's metadata.
+
+        Returns:
+            - (Iterator[tuple]): the index of the slab's first patch and the predicted slab.
+        """
+        input_slices = self._pre_processor.iter_slices(slices, meta_data)
+        for start_idx, batch in self._patcher.iter_batches(input_slices, self._batch_size):
+            # The first streamed batch is the one compared against fp32, as the volume's first batch otherwise
+            self._check_tolerance(batch)
+            with self._profiler.batch():
+                slab = self._engine(batch)
+            yield start_idx, slab
+
+    def finalize(self, prediction: torch.Tensor, meta_data: dict, file_path: str, timings: dict,
+                 on_saved=None) -> str:
+        """
+        Post-processes and saves a study's predicted noise, in background if "background_save" is set.
+
+        Parameters:
+            - prediction (torch.Tensor): the predicted noise.
+            - meta_data (dict): the study's metadata.
+            - file_path (str): the study's path.
+            - timings (dict): the stages' timings to fill.
+            - on_saved (callable): called with the saved file's path once written.
+
+        Returns:
+            - (str): the saved file's path.
+        """
+        # Post-processing
+        with self._profiler.stage("post_processing", "Post-processing de l'estimation", timings):
+            prediction = self._post_processor.launch(prediction, meta_data)
 
         # Saving
-        print("\nSauvegarde de l'estimation")
-        self._save(prediction)
+        with self._profiler.stage("saving", "Sauvegarde de l'estimation", timings):
+            output_path = self._save(prediction, meta_data, file_path, on_saved)
+
+        return output_path
+
+    def build_loader(self, file_type: str, file_path: str = None):
+        """
+        Builds the loader matching the input file type.
+
+        Parameters:
+            - file_type (str): the input file type, a registered one or "auto" to detect it from the file's content.
+            - file_path (str): the input file path, needed to detect its file type.
+
+        Returns:
+            - (FileLoader): the file loader, None if the file type is "auto" and there is no file yet.
+        """
+        if file_type == "auto":
+            if file_path is None:
+                return None
+            file_type = loading.detect_file_type(file_path)
+
+        # The loaders are imported on use, a nrrd input never loads the dicom libraries
+        return loading.build_loader(file_type, self._params)
 
     def _predict_noise(self, input_volume: torch.Tensor) -> torch.Tensor:
         """
@@ -117,21 +440,176 @@ class PredictionManagement:
         Returns:
             - (torch.Tensor): the predicted noise as a tensor.
         """
-        prediction = torch.Tensor()
+        prediction = self._patcher.allocate_volume(input_volume.shape)
+        if self._params.get("skip_threshold") is not None:
+            return self._predict_occupied_noise(input_volume, prediction)
+        if self._data_parallel is not None:
+            return self._data_parallel.predict(
+                input_volume, prediction, self._batch_size, precision=self._engine.precision
+            )
+
         for i in tqdm(range(0, input_volume.shape[0], self._batch_size)):
-            batch = input_volume[i: i + self._batch_size].to(torch.device(self._DEVICE))
+            with self._profiler.batch():
+                probs = self._engine(input_volume[i: i + self._batch_size])
+            self._patcher.insert_patches(prediction, probs, i)
 
-            probs = self._model(batch).detach()
-            prediction = torch.cat((prediction, probs.cpu()), dim=0)
+        return prediction
 
-        prediction = torch.movedim(prediction, 0, 1)
-        return self._patcher.aggregate_patches(prediction).cpu()
+    def _predict_occupied_noise(self, input_volume: torch.Tensor, prediction: torch.Tensor) -> torch.Tensor:
+        """
+        Predicts volume's noise on the occupied patches only, the empty ones are filled with a constant.
+
+        Parameters:
+            - input_volume (torch.Tensor): the volume to predict noise from.
+            - prediction (torch.Tensor): the aggregated volume to fill.
+
+        Returns:
+            - (torch.Tensor): the predicted noise as a tensor.
+        """
+        occupancy = self._patcher.get_occupancy(input_volume, self._params["skip_threshold"])
+        occupied_idx = torch.nonzero(occupancy).flatten()
+        empty_idx = torch.nonzero(~occupancy).flatten()
+
+        self._skipped_patches = len(empty_idx)
+        print(f"Patchs vides ignorés: {self._skipped_patches}/{input_volume.shape[0]}.")
+
+        if self._params.get("skip_value", 0.):
+            prediction[:, empty_idx + self._patch_height // 2] = self._params["skip_value"]
 
-    def _save(self, volume: torch.Tensor):
+        for i in tqdm(range(0, len(occupied_idx), self._batch_size)):
+            batch_idx = occupied_idx[i: i + self._batch_size]
+
+            # Occupied patches mostly form runs, a run is a view of the patches instead of a gathered copy
+            if batch_idx[-1] - batch_idx[0] + 1 == len(batch_idx):
+                batch = input_volume[batch_idx[0]: batch_idx[-1] + 1]
+            else:
+                batch = input_volume[batch_idx]
+
+            with self._profiler.batch():
+                probs = self._engine(batch)
+            self._patcher.scatter_patches(prediction, probs, batch_idx)
+
+        return prediction
+
+    def _check_tolerance(self, input_volume: torch.Tensor):
+        """
+        Compares the inference engine against the fp32 one on the first batch, falls back to fp32 if needed.
+
+        Parameters:
+            - input_volume (torch.Tensor): the volume to predict noise from.
+        """
+        tolerance = self._params.get("tolerance", 0)
+        if tolerance <= 0 or self._engine.precision == "fp32" or self._tolerance_checked:
+            return
+
+        self._tolerance_checked = True
+        report = compare_engines(
+            self._build_reference_engine(), self._engine, input_volume[:self._batch_size], atol=tolerance
+        )
+        print(f"Erreur max: {report['max_abs_error']:.3e}, accélération: x{round(report['speedup'], 2)}.")
+
+        if not report["within_tolerance"]:
+            print("Tolérance dépassée, retour en fp32.")
+            self._engine = self._build_reference_engine()
+
+    def _build_tiled_engine(self, engine):
+        """
+        Wraps an engine to predict in-plane tiles if tiling is set.
+
+        Parameters:
+            - engine (InferenceEngine | ONNXEngine): the engine to wrap.
+
+        Returns:
+            - (InferenceEngine | ONNXEngine | TiledEngine): the engine, tiled if tiling is set.
+        """
+        if self._tiling is None:
+            return engine
+        return TiledEngine(engine, *self._tiling)
+
+    def _build_reference_engine(self):
+        """
+        Builds the fp32 engine the other precisions are compared against, it shares the model and its layout.
+
+        Returns:
+            - (InferenceEngine | TiledEngine): the fp32 engine, tiled if tiling is set.
+        """
+        return self._build_tiled_engine(InferenceEngine(self._model, channels_last=self._channels_last))
+
+    def close(self):
+        """
+        Waits for the background saves, then stops the background writer and the data parallel workers.
+        """
+        try:
+            self.wait_saves()
+        finally:
+            self._saver.close()
+            if self._data_parallel is not None:
+                self._data_parallel.close()
+                self._data_parallel = None
+
+    def save_metrics(self):
+        """
+        Writes the recorded metrics if a metrics path is set, as JSON or Prometheus text.
+        """
+        if self._params.get("metrics_path") is not None:
+            self._profiler.save(self._params["metrics_path"])
+
+    def wait_saves(self):
+        """
+        Waits for the background saves to be written, then raises the first failed one's error.
+        """
+        errors = [error for _, error in self.collect_saves() if error is not None]
+        if errors:
+            raise errors[0]
+
+    def collect_saves(self) -> list:
+        """
+        Waits for the background saves to be written.
+
+        Returns:
+            - (list): the saved files' paths and their write's error, None if the write succeeded.
+        """
+        pending, self._pending_saves = self._pending_saves, list()
+        return [(output_path, future.exception()) for output_path, future in pending]
+
+    @staticmethod
+    def _build_saver(output_format: str, half: bool):
+        """
+        Builds the saver matching the output format.
+
+        Parameters:
+            - output_format (str): the output format, "pt", "npy", "npz" or "nrrd".
+            - half (bool): whether to store the volume as float16.
+
+        Returns:
+            - (FileSaver): the file saver.
+        """
+        savers = {"pt": "TensorSaver", "npy": "NumpySaver", "npz": "NumpyCompressedSaver", "nrrd": "NRRDSaver"}
+        if output_format not in savers:
+            raise ValueError(f"Unknown output format: {output_format}.")
+
+        return getattr(saving, savers[output_format])(half=half)
+
+    def _save(self, volume: torch.Tensor, meta_data: dict, file_path: str, on_saved=None) -> str:
         """
         Saves volume's noise.
 
         Parameters:
             - volume (torch.Tensor): the volume to save.
+            - meta_data (dict): the input file's metadata.
+            - file_path (str): the input file path.
+            - on_saved (callable): called with the saved file's path once written.
+
+        Returns:
+            - (str): the saved file's path.
         """
-        torch.save(volume, os.path.join(os.path.dirname(self._file_path), f"noise_volume.pt"))
+        output_path = self._saver.get_output_path(file_path)
+        if not self._params.get("background_save", False):
+            return self._saver.save(volume, output_path, meta_data, on_saved=on_saved)
+
+        # The callback runs in the write's thread, after the write succeeded; wait_saves raises their errors
+        self._pending_saves.append(
+            (output_path, self._saver.save_async(volume, output_path, meta_data, on_saved=on_saved))
+        )
+
+        return output_path
@@ -0,0 +1,210 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Records per-stage and per-batch metrics, reports them as JSON or Prometheus text.
+"""
+
+# IMPORT: utils
+import json
+import time
+import bisect
+import threading
+import contextlib
+
+# IMPORT: deep learning
+import torch
+
+# IMPORT: project
+import utils
+
+
+class Profiler:
+    _BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10.)
+
+    def __init__(self, trace_path: str = None, verbose: bool = True):
+        """
+        Initializes an instance of Profiler class.
+
+        Parameters:
+            - trace_path (str): the torch.profiler chrome trace's path, no trace if None.
+            - verbose (bool): whether to print the stages and their wall time.
+        """
+        self._trace_path = trace_path
+        self._verbose = verbose
+        self._lock = threading.Lock()
+
+        self._stages = list()
+        self._batches = [0] * (len(self._BUCKETS) + 1)
+        self._batches_sum = 0.
+
+        # The running stages and the number of started ones, to detect overlapping stages (pipeline mode)
+        self._active_stages = 0
+        self._started_stages = 0
+
+    def reset(self):
+        """
+        Forgets the recorded metrics.
+        """
+        with self._lock:
+            self._stages = list()
+            self._batches = [0] * (len(self._BUCKETS) + 1)
+            self._batches_sum = 0.
+        utils.reset_volume_copies()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, message: str = None, timings: dict = None):
+        """
+        Records a stage's wall time, CPU time and peak RSS growth, even if the stage fails.
+
+        The CPU time and the peak RSS are process-wide: they are only recorded for a stage running alone,
+        overlapping stages (pipeline mode) get None.
+
+        Parameters:
+            - name (str): the stage's name.
+            - message (str): the message printed when the stage starts.
+            - timings (dict): the stages' wall times to fill.
+        """
+        if self._verbose and message is not None:
+            print(f"\n{message}")
+
+        with self._lock:
+            overlapped = self._active_stages > 0
+            self._active_stages += 1
+            self._started_stages += 1
+            started_stages = self._started_stages
+
+        # The peak is reset so it only covers this stage, Linux only: elsewhere it is the growth of the lifetime peak
+        if not overlapped:
+            utils.reset_peak_rss()
+        wall_start, cpu_start, rss_start = time.perf_counter(), time.process_time(), utils.get_rss()
+
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            with self._lock:
+                self._active_stages -= 1
+                overlapped = overlapped or self._started_stages != started_stages
+
+            metrics = {
+                "stage": name,
+                "failed": failed,
+                "wall_seconds": time.perf_counter() - wall_start,
+                "cpu_seconds": None if overlapped else time.process_time() - cpu_start,
+                "peak_rss_growth_bytes": None if overlapped else max(0, utils.get_peak_rss() - rss_start)
+            }
+            with self._lock:
+                self._stages.append(metrics)
+
+        if timings is not None:
+            timings[name] = metrics["wall_seconds"]
+        if self._verbose and message is not None:
+            print(f"{round(metrics['wall_seconds'], 3)} secondes.")
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Records a batch's model latency into the histogram.
+        """
+        start = time.perf_counter()
+        yield
+
+        latency = time.perf_counter() - start
+        with self._lock:
+            self._batches[bisect.bisect_left(self._BUCKETS, latency)] += 1
+            self._batches_sum += latency
+
+    @contextlib.contextmanager
+    def trace(self):
+        """
+        Records a torch.profiler trace if a trace path is set.
+        """
+        if self._trace_path is None:
+            yield
+            return
+
+        with torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True
+        ) as profiler:
+            yield
+        profiler.export_chrome_trace(self._trace_path)
+
+    def report(self) -> dict:
+        """
+        Returns the recorded metrics.
+
+        Returns:
+            - (dict): the stages' metrics, the batches' latency histogram and the full-volume copies by origin.
+        """
+        with self._lock:
+            cumulated = 0
+            buckets = dict()
+            for bucket, count in zip(list(self._BUCKETS) + ["+Inf"], self._batches):
+                cumulated += count
+                buckets[str(bucket)] = cumulated
+
+            return {
+                "stages": list(self._stages),
+                "batch_latency": {"buckets": buckets, "count": cumulated, "sum": self._batches_sum},
+                "volume_copies": utils.get_volume_copies()
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the recorded metrics in the Prometheus text format.
+
+        Returns:
+            - (str): the metrics.
+        """
+        report = self.report()
+        lines = list()
+
+        # A stage runs once per study, its samples are aggregated so every label set is unique
+        stages = dict()
+        for metrics in report["stages"]:
+            stages.setdefault(metrics["stage"], list()).append(metrics)
+
+        for metric, key, aggregate in [
+            ("prediction_stage_runs", None, len),
+            ("prediction_stage_failures", "failed", sum),
+            ("prediction_stage_wall_seconds", "wall_seconds", sum),
+            ("prediction_stage_cpu_seconds", "cpu_seconds", sum),
+            ("prediction_stage_peak_rss_growth_bytes", "peak_rss_growth_bytes", max)
+        ]:
+            lines.append(f"# TYPE {metric} gauge")
+            for stage, runs in stages.items():
+                values = runs if key is None else [run[key] for run in runs if run[key] is not None]
+                if values:
+                    lines.append(f'{metric}{{stage="{stage}"}} {aggregate(values)}')
+
+        lines.append("# TYPE prediction_volume_copies gauge")
+        lines.extend(
+            f'prediction_volume_copies{{origin="{origin}"}} {count}'
+            for origin, count in report["volume_copies"].items()
+        )
+
+        lines.append("# TYPE prediction_batch_latency_seconds histogram")
+        lines.extend(
+            f'prediction_batch_latency_seconds_bucket{{le="{bucket}"}} {count}'
+            for bucket, count in report["batch_latency"]["buckets"].items()
+        )
+        lines.append(f'prediction_batch_latency_seconds_sum {report["batch_latency"]["sum"]}')
+        lines.append(f'prediction_batch_latency_seconds_count {report["batch_latency"]["count"]}')
+
+        return "\n".join(lines) + "\n"
+
+    def save(self, path: str):
+        """
+        Writes the recorded metrics, as JSON if the path ends with .json else as Prometheus text.
+
+        Parameters:
+            - path (str): the report's path.
+        """
+        with open(path, "w") as report_file:
+            if path.endswith(".json"):
+                json.dump(self.report(), report_file, indent=4)
+            else:
+                report_file.write(self.to_prometheus())
@@ -0,0 +1 @@
+from .file_saving import TensorSaver, NumpySaver, NumpyCompressedSaver, NRRDSaver
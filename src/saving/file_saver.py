@@ -0,0 +1,103 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose:
+"""
+
+# IMPORT: utils
+import os
+from concurrent.futures import ThreadPoolExecutor, Future
+
+# IMPORT: tensor
+import torch
+
+# IMPORT: project
+import utils
+
+
+class FileSaver:
+    _EXTENSION = None
+
+    def __init__(self, half: bool = False):
+        """
+        Initializes an instance of FileSaver class.
+
+        Parameters:
+            - half (bool): whether to store the volume as float16.
+        """
+        self._half = half
+
+        # The background writer, started by the first save_async and stopped by close
+        self._executor = None
+
+    def get_output_path(self, file_path: str) -> str:
+        """
+        Returns the path of the saved noise, next to the input file.
+
+        Parameters:
+            - file_path (str): the input file's path.
+
+        Returns:
+            - (str): the saved file's path.
+        """
+        return os.path.join(os.path.dirname(file_path), f"noise_volume{self._EXTENSION}")
+
+    def save(self, volume: torch.Tensor, output_path: str, meta_data: dict = None, on_saved=None) -> str:
+        """
+        Saves volume.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to save.
+            - output_path (str): the saved file's path.
+            - meta_data (dict): the input file's metadata.
+            - on_saved (callable): called with the saved file's path, only once the write succeeded.
+
+        Returns:
+            - (str): the saved file's path.
+        """
+        if self._half:
+            volume = volume.half()
+            utils.count_volume_copy("half")
+
+        self._save(volume, output_path, meta_data)
+        if on_saved is not None:
+            on_saved(output_path)
+        return output_path
+
+    def save_async(self, volume: torch.Tensor, output_path: str, meta_data: dict = None, on_saved=None) -> Future:
+        """
+        Saves volume in a background thread, the writes are done in submission order.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to save, must not be modified until the write is done.
+            - output_path (str): the saved file's path.
+            - meta_data (dict): the input file's metadata.
+            - on_saved (callable): called with the saved file's path, only once the write succeeded.
+
+        Returns:
+            - (Future): the write and its callback, raises their error; its result is the saved file's path.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor.submit(self.save, volume, output_path, meta_data, on_saved)
+
+    def close(self):
+        """
+        Waits for the background writes, then stops the background writer.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _save(self, volume: torch.Tensor, output_path: str, meta_data: dict):
+        """
+        Saves volume.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to save.
+            - output_path (str): the saved file's path.
+            - meta_data (dict): the input file's metadata.
+        """
+        raise NotImplementedError()
@@ -0,0 +1,3 @@
+from .tensor_saving import TensorSaver
+from .numpy_saving import NumpySaver, NumpyCompressedSaver
+from .nrrd_saving import NRRDSaver
@@ -0,0 +1,53 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose:
+"""
+
+# IMPORT: data saving
+import nrrd
+
+# IMPORT: data processing
+import numpy as np
+
+# IMPORT: project
+from src.saving.file_saver import FileSaver
+
+
+class NRRDSaver(FileSaver):
+    _EXTENSION = ".nrrd"
+
+    def __init__(self, half: bool = False):
+        """
+        Initializes an instance of NRRDSaver class.
+
+        Parameters:
+            - half (bool): whether to store the volume as float16.
+        """
+        if half:
+            raise ValueError("NRRD has no float16 type.")
+
+        super(NRRDSaver, self).__init__(half)
+
+    def _save(self, volume, output_path, meta_data):
+        """
+        Saves volume as a NRRD file, in the NRRD input's axis order and geometry so both overlay.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to save.
+            - output_path (str): the saved file's path.
+            - meta_data (dict): the input file's metadata.
+        """
+        # Undo NRRDLoader's axis adjustment, written as a view: pynrrd serializes it in a single pass
+        volume = np.rot90(volume[0].numpy(), k=-1, axes=(0, 2))
+
+        header = dict()
+        if meta_data is not None and meta_data.get("nrrd_header"):
+            header.update(meta_data["nrrd_header"])
+        elif meta_data is not None:
+            spacing = meta_data["spacing"]
+            header["space directions"] = np.diag((spacing[2], spacing[1], spacing[0]))
+
+        nrrd.write(output_path, volume, header)
@@ -0,0 +1,63 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose:
+"""
+
+# IMPORT: data processing
+import numpy as np
+
+# IMPORT: project
+import utils
+
+from src.saving.file_saver import FileSaver
+
+
+class NumpySaver(FileSaver):
+    _EXTENSION = ".npy"
+
+    def __init__(self, half: bool = False):
+        """
+        Initializes an instance of NumpySaver class.
+
+        Parameters:
+            - half (bool): whether to store the volume as float16.
+        """
+        super(NumpySaver, self).__init__(half)
+
+    def _save(self, volume, output_path, meta_data):
+        """
+        Saves volume as an uncompressed numpy file, readable with np.load(mmap_mode="r").
+
+        Parameters:
+            - volume (torch.Tensor): the volume to save.
+            - output_path (str): the saved file's path.
+            - meta_data (dict): the input file's metadata.
+        """
+        np.save(output_path, volume.numpy())
+
+
+class NumpyCompressedSaver(FileSaver):
+    _EXTENSION = ".npz"
+
+    def __init__(self, half: bool = False):
+        """
+        Initializes an instance of NumpyCompressedSaver class.
+
+        Parameters:
+            - half (bool): whether to store the volume as float16.
+        """
+        super(NumpyCompressedSaver, self).__init__(half)
+
+    def _save(self, volume, output_path, meta_data):
+        """
+        Saves volume as a zstd compressed numpy file, readable with utils.load_numpy_compressed.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to save.
+            - output_path (str): the saved file's path.
+            - meta_data (dict): the input file's metadata.
+        """
+        utils.save_numpy_compressed(output_path, volume.numpy())
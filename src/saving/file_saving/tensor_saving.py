@@ -0,0 +1,37 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose:
+"""
+
+# IMPORT: tensor
+import torch
+
+# IMPORT: project
+from src.saving.file_saver import FileSaver
+
+
+class TensorSaver(FileSaver):
+    _EXTENSION = ".pt"
+
+    def __init__(self, half: bool = False):
+        """
+        Initializes an instance of TensorSaver class.
+
+        Parameters:
+            - half (bool): whether to store the volume as float16.
+        """
+        super(TensorSaver, self).__init__(half)
+
+    def _save(self, volume, output_path, meta_data):
+        """
+        Saves volume as a torch file.
+
+        Parameters:
+            - volume (torch.Tensor): the volume to save.
+            - output_path (str): the saved file's path.
+            - meta_data (dict): the input file's metadata.
+        """
+        torch.save(volume, output_path)
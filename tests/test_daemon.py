@@ -0,0 +1,68 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the daemon's handling of the received jobs, the predictor is replaced by a recording one.
+"""
+
+# IMPORT: utils
+import io
+import json
+
+# IMPORT: test
+import pytest
+
+# IMPORT: project
+daemon = pytest.importorskip("src.daemon")
+
+
+class RecordingPredictor:
+    def __init__(self):
+        self.files = list()
+
+    def set_input(self, file_path: str, file_type: str):
+        self.files.append((file_path, file_type))
+
+    def launch(self) -> dict:
+        if self.files[-1][0] == "broken":
+            raise ValueError("broken study")
+        return {"output_path": f"{self.files[-1][0]}.pt", "timings": dict(), "skipped_patches": 0, "cached": False}
+
+    def wait_saves(self):
+        pass
+
+
+@pytest.fixture
+def prediction_daemon():
+    prediction_daemon = daemon.PredictionDaemon.__new__(daemon.PredictionDaemon)
+    prediction_daemon._predictor = RecordingPredictor()
+    return prediction_daemon
+
+
+@pytest.mark.parametrize("line", ["{not json", "", "\"study\"", "[1, 2]", "{\"file_type\": \"nrrd\"}", b"\xff\xfe"])
+def test_malformed_line(prediction_daemon, line):
+    result = prediction_daemon.process_line(line)
+
+    assert result["status"] == "error"
+    assert result["file"] is None
+    assert prediction_daemon._predictor.files == list()
+
+
+def test_valid_line(prediction_daemon):
+    result = prediction_daemon.process_line(json.dumps({"file": "study.nrrd"}))
+
+    assert result["status"] == "done"
+    assert result["output_path"] == "study.nrrd.pt"
+    assert prediction_daemon._predictor.files == [("study.nrrd", "auto")]
+
+
+def test_serve_stdin_continues_after_errors(prediction_daemon):
+    stdin = io.StringIO("{not json\n\n{\"file\": \"broken\"}\n{\"file\": \"study\", \"file_type\": \"dicom\"}\n")
+    stdout = io.StringIO()
+    prediction_daemon.serve_stdin(stdin=stdin, stdout=stdout)
+
+    results = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [result["status"] for result in results] == ["error", "error", "done"]
+    assert results[1]["file"] == "broken" and "broken study" in results[1]["error"]
+    assert results[2]["file"] == "study"
@@ -0,0 +1,93 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the dicom index's incremental updates and its series selection.
+"""
+
+# IMPORT: utils
+import os
+import shutil
+
+# IMPORT: test
+import pytest
+
+# IMPORT: data loading
+pytest.importorskip("torch")
+pytest.importorskip("zstd")
+pytest.importorskip("nrrd")
+pytest.importorskip("pydicom")
+
+# IMPORT: project
+from benchmarks.synthetic import generate_dicom_series
+from src.loading.dicom_index import DicomIndex
+from src.loading.file_loading.dicom_loading import DicomLoader
+
+
+@pytest.fixture
+def dicom_path(tmp_path):
+    # Two series of 4 and 6 slices in the same directory
+    dicom_path = str(tmp_path / "dicom")
+    os.makedirs(dicom_path)
+    for seed, depth in enumerate((4, 6)):
+        series_path = generate_dicom_series(str(tmp_path / f"series_{seed}"), depth, (2., 4., 4.), matrix=16, seed=seed)
+        for file_name in os.listdir(series_path):
+            shutil.move(os.path.join(series_path, file_name), os.path.join(dicom_path, f"{seed}_{file_name}"))
+
+    return dicom_path
+
+
+def get_series_uid(index: DicomIndex, num_files: int) -> str:
+    return next(s["series_uid"] for s in index.get_series() if s["num_files"] == num_files)
+
+
+def test_update(tmp_path, dicom_path):
+    index = DicomIndex(dicom_path, index_path=str(tmp_path / "index"))
+    assert index.update() == 10
+    assert index.update() == 0
+    assert sorted(s["num_files"] for s in index.get_series()) == [4, 6]
+
+    # Only the modified and added files are read again, the removed ones are forgotten
+    os.utime(os.path.join(dicom_path, "0_0000.dcm"), ns=(0, 0))
+    os.remove(os.path.join(dicom_path, "1_0005.dcm"))
+    with open(os.path.join(dicom_path, "notes.txt"), "w") as file:
+        file.write("not a dicom file")
+
+    assert DicomIndex(dicom_path, index_path=str(tmp_path / "index")).update() == 2
+    assert sorted(s["num_files"] for s in index.get_series()) == [4, 5]
+    assert index.update() == 0
+
+
+def test_select(tmp_path, dicom_path):
+    index = DicomIndex(dicom_path, index_path=str(tmp_path / "index"))
+    index.update()
+
+    with pytest.raises(ValueError, match="Several"):
+        index.select()
+    with pytest.raises(ValueError):
+        index.select(modality="CT")
+
+    files = index.select(series_uid=get_series_uid(index, 6))
+    assert [header["InstanceNumber"] for header, _ in files] == list(range(1, 7))
+    assert all(os.path.basename(file_path).startswith("1_") for _, file_path in files)
+
+
+def test_loader_series_selection(tmp_path, dicom_path):
+    index = DicomIndex(dicom_path, index_path=str(tmp_path / "index"))
+    index.update()
+
+    loader = DicomLoader(series_uid=get_series_uid(index, 4), index_path=str(tmp_path / "index"))
+    volume = loader.load(dicom_path)
+    assert volume.shape == (1, 4, 16, 16)
+    assert loader.get_meta_data()["series_uid"] == get_series_uid(index, 4)
+
+
+def test_eviction(tmp_path, dicom_path):
+    index_path = str(tmp_path / "index")
+    DicomIndex(str(tmp_path / "series_0"), index_path=index_path)
+    os.utime(next(os.scandir(index_path)).path, (1000, 1000))
+
+    # The least recently used index is removed, the opened one is always kept
+    DicomIndex(dicom_path, index_path=index_path, max_size=1)
+    assert len([f for f in os.listdir(index_path) if f.endswith(".sqlite")]) == 1
@@ -0,0 +1,95 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the memory-mapped NRRD and numpy loaders against the libraries' readers.
+"""
+
+# IMPORT: test
+import pytest
+
+# IMPORT: data processing
+torch = pytest.importorskip("torch")
+np = pytest.importorskip("numpy")
+nrrd = pytest.importorskip("nrrd")
+pytest.importorskip("zstd")
+
+# IMPORT: project
+import utils
+
+from src.loading.file_loading.nrrd_loading import NRRDLoader
+from src.loading.file_loading.numpy_loading import NumpyLoader, NumpyCompressedLoader
+from src.saving import NumpyCompressedSaver
+
+_HEADER = {"space": "left-posterior-superior", "space directions": np.diag([1.5, 2.5, 3.])}
+
+
+def get_volume(dtype="<f4"):
+    return np.random.default_rng(0).uniform(0, 1000, size=(12, 10, 6)).astype(dtype)
+
+
+@pytest.mark.parametrize("file_name, dtype, detached_header, mapped", [
+    ("attached.nrrd", "<f4", False, True),
+    ("big_endian.nrrd", ">f4", False, True),
+    ("short.nrrd", "<i2", False, True),
+    ("detached.nhdr", "<f4", True, True),
+    ("detached_big_endian.nhdr", ">u2", True, True),
+    ("gzip.nrrd", "<f4", False, False),
+])
+def test_nrrd(tmp_path, file_name, dtype, detached_header, mapped):
+    file_path = str(tmp_path / file_name)
+    encoding = "raw" if mapped else "gzip"
+    nrrd.write(file_path, get_volume(dtype), {**_HEADER, "encoding": encoding}, detached_header=detached_header)
+
+    # Raw data is memory-mapped, encoded data falls back to pynrrd
+    assert (NRRDLoader._map_raw_data(file_path, nrrd.read_header(file_path)) is not None) == mapped
+
+    loader = NRRDLoader()
+    volume = loader.load(file_path)
+    expected = np.rot90(nrrd.read(file_path)[0], k=1, axes=(0, 2)).astype(np.float32)
+
+    assert volume.shape == (1, 6, 10, 12)
+    assert torch.equal(volume[0], torch.from_numpy(expected.copy()))
+    assert loader.get_meta_data()["spacing"] == (3., 2.5, 1.5)
+
+
+def test_nrrd_slices(tmp_path):
+    # The streamed slices are views of the memory map, equal to the loaded volume's slices
+    file_path = str(tmp_path / "volume.nrrd")
+    nrrd.write(file_path, get_volume(), {**_HEADER, "encoding": "raw"})
+
+    slices = NRRDLoader().load_slices(file_path)
+    volume = NRRDLoader().load(file_path)
+
+    assert isinstance(slices.base, np.memmap) or isinstance(slices, np.memmap)
+    assert all(torch.equal(volume[0, i], torch.from_numpy(np.array(slices[i]))) for i in range(len(slices)))
+
+
+def test_numpy_zero_copy(tmp_path):
+    file_path = str(tmp_path / "volume.npy")
+    np.save(file_path, get_volume())
+
+    utils.reset_volume_copies()
+    volume = NumpyLoader(zero_copy=True).load(file_path)
+    assert sum(utils.get_volume_copies().values()) == 0
+    assert torch.equal(volume[0], torch.from_numpy(get_volume()))
+
+    # The memory map is copy-on-write, the file is never modified
+    volume.zero_()
+    assert np.array_equal(np.load(file_path), get_volume())
+
+    utils.reset_volume_copies()
+    NumpyLoader().load(file_path)
+    assert sum(utils.get_volume_copies().values()) == 1
+
+
+@pytest.mark.parametrize("half", [False, True])
+def test_numpy_compressed_round_trip(tmp_path, half):
+    volume = torch.from_numpy(get_volume())[None]
+    output_path = NumpyCompressedSaver(half=half).save(volume, str(tmp_path / "volume.npz"), dict())
+
+    loaded = NumpyCompressedLoader().load(output_path)
+    expected = volume.half().float() if half else volume
+    assert loaded.dtype == torch.float32
+    assert torch.equal(loaded, expected)
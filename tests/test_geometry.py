@@ -0,0 +1,87 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the geometry engine against the torchio resampling and crop or pad it replaces.
+"""
+
+# IMPORT: test
+import pytest
+
+# IMPORT: tensor
+torch = pytest.importorskip("torch")
+tio = pytest.importorskip("torchio")
+pytest.importorskip("zstd")
+
+# IMPORT: project
+from src.image_processing.geometry import GeometryEngine
+
+_DEFAULT_SPACING = (2., 1.5234375, 1.5234375)
+_INPUT_SPACING = (1., 0.76171875, 0.76171875)
+
+
+def transform_with_torchio(volume, input_spacing, output_spacing, target_shape):
+    # The previous pre- and post-processing: identity affine, relative spacing, then centered crop or pad
+    volume = tio.Resample(
+        target=tuple(out_sp / in_sp for in_sp, out_sp in zip(input_spacing, output_spacing)),
+        image_interpolation="linear"
+    )(volume)
+    return tio.CropOrPad(target_shape, padding_mode=0)(volume).data
+
+
+def get_ramp(shape):
+    z, x, y = torch.meshgrid(*[torch.arange(size, dtype=torch.float32) for size in shape], indexing="ij")
+    return (3 * z + 2 * x + y)[None]
+
+
+@pytest.mark.parametrize("plane_size, desired_shape", [(64, None), (80, 32), (84, 32), (48, 32), (42, 32)])
+def test_to_model_grid(plane_size, desired_shape):
+    # Resampled planes of 32, cropped from 40 or 42 and padded from 24 or 21
+    volume = torch.rand((1, 20, plane_size, plane_size))
+    output = GeometryEngine(_DEFAULT_SPACING, desired_shape=desired_shape).to_model_grid(volume, _INPUT_SPACING)
+
+    plane_shape = (plane_size // 2, plane_size // 2) if desired_shape is None else (desired_shape, desired_shape)
+    expected = transform_with_torchio(volume, _INPUT_SPACING, _DEFAULT_SPACING, (10, *plane_shape))
+    assert output.shape == expected.shape
+    torch.testing.assert_close(output, expected, atol=1e-4, rtol=1e-4)
+
+
+def test_to_model_grid_exact_spacing():
+    volume = torch.rand((1, 6, 40, 21))
+    output = GeometryEngine(_DEFAULT_SPACING, desired_shape=32).to_model_grid(volume, _DEFAULT_SPACING)
+
+    assert torch.equal(output, tio.CropOrPad((6, 32, 32), padding_mode=0)(volume).data)
+
+
+def test_from_model_grid():
+    # Upsampling samples outside the model grid on the borders, torchio pads them where the engine clamps
+    volume = torch.rand((1, 10, 32, 32))
+    output = GeometryEngine(_DEFAULT_SPACING).from_model_grid(volume, _INPUT_SPACING, (20, 64, 64))
+
+    expected = transform_with_torchio(volume, _DEFAULT_SPACING, _INPUT_SPACING, (20, 64, 64))
+    assert output.shape == (1, 20, 64, 64)
+    torch.testing.assert_close(output[:, 1:-1, 1:-1, 1:-1], expected[:, 1:-1, 1:-1, 1:-1], atol=1e-4, rtol=1e-4)
+
+
+def test_round_trip():
+    # Trilinear interpolation is exact on a linear ramp, only the clamped borders differ
+    volume = get_ramp((20, 64, 64))
+    geometry = GeometryEngine(_DEFAULT_SPACING, desired_shape=None)
+
+    model_volume = geometry.to_model_grid(volume, _INPUT_SPACING)
+    output = geometry.from_model_grid(model_volume, _INPUT_SPACING, (20, 64, 64))
+
+    assert model_volume.shape == (1, 10, 32, 32)
+    assert output.shape == volume.shape
+    torch.testing.assert_close(output[:, 1:-1, 1:-1, 1:-1], volume[:, 1:-1, 1:-1, 1:-1], atol=1e-3, rtol=1e-5)
+
+
+def test_slab_size(monkeypatch):
+    # A volume sampled slab by slab equals the volume sampled at once
+    volume = torch.rand((1, 20, 48, 48))
+    expected = GeometryEngine(_DEFAULT_SPACING, desired_shape=32).to_model_grid(volume, _INPUT_SPACING)
+
+    monkeypatch.setattr(GeometryEngine, "_GRID_SIZE", 3 * 32 * 32)
+    output = GeometryEngine(_DEFAULT_SPACING, desired_shape=32).to_model_grid(volume, _INPUT_SPACING)
+    assert torch.equal(output, expected)
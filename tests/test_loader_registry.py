@@ -0,0 +1,112 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the file type detection from the files' content.
+"""
+
+# IMPORT: utils
+import os
+import gzip
+import zipfile
+
+# IMPORT: test
+import pytest
+
+# IMPORT: project
+from src.loading.loader_registry import detect_file_type, build_loader, get_file_types
+
+
+def write_file(file_path: str, content: bytes) -> str:
+    with open(file_path, "wb") as file:
+        file.write(content)
+    return file_path
+
+
+def get_nifti_header() -> bytes:
+    return b"\x5c\x01\x00\x00" + b"\x00" * 340 + b"n+1\x00"
+
+
+def test_file_types():
+    assert get_file_types() == ["dicom", "nrrd", "npy", "npz", "nifti"]
+
+
+def test_dicom_directory(tmp_path):
+    # The first file is not a dicom file, the directory is still detected from the next ones
+    write_file(str(tmp_path / "DICOMDIR.txt"), b"index")
+    write_file(str(tmp_path / "IM0001"), b"\x00" * 128 + b"DICM" + b"\x00" * 16)
+    assert detect_file_type(str(tmp_path)) == "dicom"
+
+
+@pytest.mark.parametrize("file_name, content, file_type", [
+    ("volume.nrrd", b"NRRD0004\ntype: float\n", "nrrd"),
+    ("volume", b"NRRD0005\n", "nrrd"),
+    ("volume.npy", b"\x93NUMPY\x01\x00", "npy"),
+    ("volume.bin", b"\x93NUMPY\x01\x00", "npy"),
+    ("volume.nii", get_nifti_header() + b"\x00" * 4, "nifti"),
+])
+def test_files(tmp_path, file_name, content, file_type):
+    # The extension is not used, only the content
+    assert detect_file_type(write_file(str(tmp_path / file_name), content)) == file_type
+
+
+def test_gzipped_nifti(tmp_path):
+    file_path = str(tmp_path / "volume.nii.gz")
+    with gzip.open(file_path, "wb") as file:
+        file.write(get_nifti_header() + b"\x00" * 4)
+
+    assert detect_file_type(file_path) == "nifti"
+
+
+def test_numpy_compressed(tmp_path):
+    file_path = str(tmp_path / "volume.npz")
+    with zipfile.ZipFile(file_path, "w") as archive:
+        archive.writestr("shape.npy", b"\x93NUMPY")
+        archive.writestr("dtype.npy", b"\x93NUMPY")
+        archive.writestr("data.npy", b"")
+
+    assert detect_file_type(file_path) == "npz"
+
+
+@pytest.mark.parametrize("file_name, content", [
+    ("notes.txt", b"not a volume"),
+    ("empty", b""),
+    ("truncated.nii.gz", b"\x1f\x8b\x08\x00"),
+    ("broken.zip", b"PK\x03\x04 broken"),
+])
+def test_unknown_files(tmp_path, file_name, content):
+    with pytest.raises(ValueError, match="Unknown file format"):
+        detect_file_type(write_file(str(tmp_path / file_name), content))
+
+
+@pytest.mark.parametrize("file_name, entries", [
+    ("document.docx", ("word/document.xml",)),
+    ("pickled.npz", ("header.npy", "data.npy")),
+])
+def test_unknown_archive(tmp_path, file_name, entries):
+    # A zip archive without the compressed volume's entries: an office document, or a pickled header never opened
+    file_path = str(tmp_path / file_name)
+    with zipfile.ZipFile(file_path, "w") as archive:
+        for entry in entries:
+            archive.writestr(entry, b"\x93NUMPY")
+
+    with pytest.raises(ValueError, match="Unknown file format"):
+        detect_file_type(file_path)
+
+
+def test_unknown_directories(tmp_path):
+    write_file(str(tmp_path / "notes.txt"), b"not a dicom file")
+    os.makedirs(tmp_path / "empty")
+
+    with pytest.raises(ValueError, match="Unknown file format"):
+        detect_file_type(str(tmp_path))
+    with pytest.raises(ValueError, match="Unknown file format"):
+        detect_file_type(str(tmp_path / "empty"))
+    with pytest.raises(ValueError, match="Unknown file format"):
+        detect_file_type(str(tmp_path / "missing"))
+
+
+def test_unknown_file_type():
+    with pytest.raises(ValueError, match="Unknown file type"):
+        build_loader("png", dict())
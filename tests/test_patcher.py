@@ -0,0 +1,97 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the patches' generation and their aggregation into the predicted volume.
+"""
+
+# IMPORT: test
+import pytest
+
+# IMPORT: tensor
+torch = pytest.importorskip("torch")
+pytest.importorskip("zstd")
+
+# IMPORT: project
+from src.patching import Patcher
+
+
+def test_generate_patches():
+    volume = torch.rand((1, 9, 8, 8))
+    patches = Patcher(patch_height=5).generate_patches(volume)
+
+    assert patches.shape == (5, 5, 8, 8)
+    for i in range(patches.shape[0]):
+        assert torch.equal(patches[i], volume[0, i: i + 5])
+
+
+def test_generate_patches_short_volume():
+    with pytest.raises(ValueError):
+        Patcher(patch_height=5).generate_patches(torch.rand((1, 4, 8, 8)))
+    with pytest.raises(ValueError):
+        Patcher(patch_height=5).generate_patches(torch.rand((1, 1, 8, 8)))
+
+
+def test_insert_patches():
+    # Batches written at their offset give the same volume as the whole prediction aggregated at once
+    patcher = Patcher(patch_height=5)
+    probs = torch.rand((7, 1, 8, 8))
+
+    volume = patcher.allocate_volume((7, 5, 8, 8))
+    for start in range(0, 7, 3):
+        patcher.insert_patches(volume, probs[start: start + 3], start)
+
+    expected = patcher.aggregate_patches(torch.movedim(probs, 0, 1))
+    assert volume.shape == (1, 11, 8, 8)
+    assert torch.equal(volume, expected)
+    assert not volume[:, :2].any() and not volume[:, -2:].any()
+
+
+def test_scatter_patches():
+    patcher = Patcher(patch_height=5)
+    probs = torch.rand((7, 1, 8, 8))
+    patches_idx = torch.tensor([0, 3, 4, 6])
+
+    volume = patcher.allocate_volume((7, 5, 8, 8))
+    patcher.scatter_patches(volume, probs[patches_idx], patches_idx)
+
+    expected = patcher.aggregate_patches(torch.movedim(probs, 0, 1))
+    assert torch.equal(volume[:, patches_idx + 2], expected[:, patches_idx + 2])
+    assert not volume[:, torch.tensor([1, 2, 5]) + 2].any()
+
+
+def test_get_occupancy():
+    # Only the patches containing the single non-empty slice are occupied
+    patcher = Patcher(patch_height=5)
+    volume = torch.zeros((1, 12, 8, 8))
+    volume[0, 6, 3, 3] = 1.
+
+    occupancy = patcher.get_occupancy(patcher.generate_patches(volume), threshold=0.5)
+    assert occupancy.tolist() == [i in range(2, 7) for i in range(8)]
+    assert not patcher.get_occupancy(patcher.generate_patches(volume), threshold=2.).any()
+
+
+def test_get_occupancy_no_patches():
+    occupancy = Patcher(patch_height=5).get_occupancy(torch.zeros((0, 5, 8, 8)), threshold=0.5)
+    assert occupancy.shape == (0,) and occupancy.dtype == torch.bool
+
+
+def test_iter_batches():
+    # Streamed batches are the patches generated from the whole volume
+    patcher = Patcher(patch_height=5)
+    volume = torch.rand((1, 12, 8, 8))
+
+    batches = list(patcher.iter_batches(iter(volume[0]), batch_size=3))
+    assert [start for start, _ in batches] == [0, 3, 6]
+    assert torch.equal(torch.cat([batch for _, batch in batches]), patcher.generate_patches(volume))
+    assert patcher.get_num_patches(12) == 8
+
+
+def test_allocate_shared_volume():
+    # The data parallel workers write into the volume allocated by the predictor, without any copy to shared memory
+    volume = Patcher(patch_height=5, shared=True).allocate_volume((7, 5, 8, 8))
+
+    assert volume.is_shared()
+    assert volume.shape == (1, 11, 8, 8) and volume.is_contiguous()
+    assert not volume.any()
@@ -0,0 +1,69 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the pipeline's per-job results, the predictor is replaced by a recording one.
+"""
+
+# IMPORT: test
+import pytest
+
+# IMPORT: project
+pipeline = pytest.importorskip("src.pipeline")
+
+
+class RecordingPredictor:
+    def __init__(self, failed_stages: dict):
+        self.failed_stages = failed_stages
+        self.metrics_saved = False
+        self._pending_saves = list()
+
+    def _run(self, stage: str, file_path: str):
+        if self.failed_stages.get(file_path) == stage:
+            raise RuntimeError(f"{stage} failed")
+
+    def build_loader(self, file_type: str, file_path: str):
+        self._run("loading", file_path)
+        return file_type
+
+    def fetch_cache(self, loader, file_path: str) -> tuple:
+        return (f"{file_path}.pt", None) if file_path == "cached" else (None, None)
+
+    def get_cache_callback(self, cache_key: str):
+        return None
+
+    def prepare(self, loader, file_path: str, timings: dict) -> tuple:
+        return file_path, {"file": file_path}
+
+    def segment(self, input_patches, timings: dict):
+        self._run("segmentation", input_patches)
+        return input_patches
+
+    def finalize(self, prediction, meta_data: dict, file_path: str, timings: dict, on_saved=None) -> str:
+        self._run("post_processing", file_path)
+        self._pending_saves.append((f"{file_path}.pt", RuntimeError("disk full") if file_path == "unsaved" else None))
+        return f"{file_path}.pt"
+
+    def collect_saves(self) -> list:
+        pending, self._pending_saves = self._pending_saves, list()
+        return pending
+
+    def save_metrics(self):
+        self.metrics_saved = True
+
+
+def test_results():
+    runner = pipeline.PipelineRunner.__new__(pipeline.PipelineRunner)
+    runner._queue_size = 1
+    runner._predictor = RecordingPredictor({"unloaded": "loading", "unpredicted": "segmentation"})
+
+    jobs = [{"file": f} for f in ("first", "unloaded", "cached", "unpredicted", "unsaved", "last")]
+    results = runner.launch(jobs + [{"file_type": "nrrd"}])
+
+    assert [result["status"] for result in results] == ["done", "error", "done", "error", "error", "done", "error"]
+    assert [result.get("file") for result in results[:-1]] == [job["file"] for job in jobs]
+    assert results[2]["cached"] and not results[0]["cached"]
+    assert "disk full" in results[4]["error"]
+    assert all("total" in result for result in results)
+    assert runner._predictor.metrics_saved
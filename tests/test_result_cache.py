@@ -0,0 +1,97 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the result cache's keys and its LRU eviction.
+"""
+
+# IMPORT: utils
+import os
+
+# IMPORT: test
+import pytest
+
+# IMPORT: data processing
+pytest.importorskip("torch")
+pytest.importorskip("zstd")
+np = pytest.importorskip("numpy")
+
+# IMPORT: project
+from src.caching import ResultCache
+from src.loading.file_loading.numpy_loading import NumpyLoader
+
+_PARAMS = {"rescale_intensity": True, "clip_value": 0, "crop_value": 0, "precision": "fp32", "output_format": "pt"}
+
+
+def write_file(file_path: str, content: bytes) -> str:
+    with open(file_path, "wb") as file:
+        file.write(content)
+    return file_path
+
+
+@pytest.fixture
+def weights_path(tmp_path):
+    return write_file(str(tmp_path / "model.pt"), b"weights")
+
+
+def test_fetch_and_store(tmp_path, weights_path):
+    cache = ResultCache(str(tmp_path / "cache"), weights_path, max_size=2 ** 20)
+    key = cache.get_key("series", _PARAMS)
+
+    assert not cache.fetch(key, str(tmp_path / "missing.pt"))
+    cache.store(key, write_file(str(tmp_path / "result.pt"), b"result"))
+    assert cache.fetch(key, str(tmp_path / "fetched.pt"))
+    with open(tmp_path / "fetched.pt", "rb") as file:
+        assert file.read() == b"result"
+
+
+def test_key_invalidation(tmp_path, weights_path):
+    cache = ResultCache(str(tmp_path / "cache"), weights_path, max_size=2 ** 20)
+    key = cache.get_key("series", _PARAMS)
+
+    assert cache.get_key("series", dict(_PARAMS)) == key
+    assert cache.get_key("other series", _PARAMS) != key
+    assert cache.get_key("series", {**_PARAMS, "precision": "bf16"}) != key
+    assert cache.get_key("series", {**_PARAMS, "tiling": True}) != key
+
+    # New weights, even with the same size, give new keys
+    write_file(weights_path, b"weighTs")
+    os.utime(weights_path, ns=(0, 0))
+    assert ResultCache(str(tmp_path / "cache"), weights_path, max_size=2 ** 20).get_key("series", _PARAMS) != key
+
+
+def test_identity_invalidation(tmp_path):
+    file_path = str(tmp_path / "study.npy")
+    loader = NumpyLoader()
+
+    np.save(file_path, np.zeros((4, 8, 8), dtype=np.float32))
+    identity = loader.get_identity(file_path)
+    assert loader.get_identity(file_path) == identity
+
+    np.save(file_path, np.ones((4, 8, 8), dtype=np.float32))
+    assert loader.get_identity(file_path) != identity
+
+
+def test_lru_eviction(tmp_path, weights_path):
+    cache = ResultCache(str(tmp_path / "cache"), weights_path, max_size=250)
+    result_path = write_file(str(tmp_path / "result.pt"), b"x" * 100)
+    keys = [cache.get_key(f"series {i}", _PARAMS) for i in range(3)]
+
+    cache.store(keys[0], result_path)
+    cache.store(keys[1], result_path)
+    os.utime(tmp_path / "cache" / keys[0], (1000, 1000))
+    os.utime(tmp_path / "cache" / keys[1], (2000, 2000))
+
+    # Fetching the oldest entry makes it the most recently used, the next store evicts the other one
+    assert cache.fetch(keys[0], str(tmp_path / "fetched.pt"))
+    cache.store(keys[2], result_path)
+
+    assert cache.fetch(keys[0], str(tmp_path / "fetched.pt"))
+    assert not cache.fetch(keys[1], str(tmp_path / "fetched.pt"))
+    assert cache.fetch(keys[2], str(tmp_path / "fetched.pt"))
+
+
+def test_no_weights(tmp_path):
+    with pytest.raises(ValueError):
+        ResultCache(str(tmp_path / "cache"), None, max_size=2 ** 20)
@@ -0,0 +1,70 @@
+"""
+Creator: HOCQUET Florian
+Date: 11/01/2023
+Version: 1.1
+
+Purpose: Tests the tiled inference's blending against a single-tile prediction.
+"""
+
+# IMPORT: test
+import pytest
+
+# IMPORT: deep learning
+torch = pytest.importorskip("torch")
+pytest.importorskip("zstd")
+
+# IMPORT: project
+from src.inference import InferenceEngine, TiledEngine
+
+
+class RecordingEngine:
+    def __init__(self, engine):
+        self.precision = engine.precision
+        self.tiles_shape = list()
+        self._engine = engine
+
+    def __call__(self, batch):
+        self.tiles_shape.append(tuple(batch.shape[-2:]))
+        return self._engine(batch)
+
+
+@pytest.fixture
+def engine():
+    # A pixel-wise model predicts the same value whatever the tile containing the pixel
+    torch.manual_seed(0)
+    return InferenceEngine(torch.nn.Conv2d(5, 2, kernel_size=1))
+
+
+@pytest.mark.parametrize("overlap", [0., 0.25, 0.5])
+def test_blending(engine, overlap):
+    batch = torch.rand((3, 5, 80, 72))
+    tiled_engine = RecordingEngine(engine)
+
+    output = TiledEngine(tiled_engine, tile_size=32, overlap=overlap)(batch)
+    expected = TiledEngine(engine, tile_size=96)(batch)
+
+    assert output.shape == expected.shape == (3, 2, 80, 72)
+    torch.testing.assert_close(output, expected, atol=1e-5, rtol=1e-5)
+    assert len(tiled_engine.tiles_shape) > 1 and set(tiled_engine.tiles_shape) == {(32, 32)}
+
+
+def test_tile_positions(engine):
+    # Stride 24: the tiles start at 0, 24 and 48 along 80 pixels, at 0, 24 and 40 along 72 pixels
+    tiled_engine = RecordingEngine(engine)
+    TiledEngine(tiled_engine, tile_size=32, overlap=0.25)(torch.rand((1, 5, 80, 72)))
+
+    assert len(tiled_engine.tiles_shape) == 9
+
+
+def test_single_tile(engine):
+    batch = torch.rand((2, 5, 32, 32))
+    tiled_engine = RecordingEngine(engine)
+
+    assert torch.equal(TiledEngine(tiled_engine, tile_size=32)(batch), engine(batch))
+    assert tiled_engine.tiles_shape == [(32, 32)]
+
+
+@pytest.mark.parametrize("tile_size, overlap", [(0, 0.25), (100, 0.25), (32, 1.), (32, -0.1)])
+def test_invalid_tiling(engine, tile_size, overlap):
+    with pytest.raises(ValueError):
+        TiledEngine(engine, tile_size=tile_size, overlap=overlap)
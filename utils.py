@@ -7,36 +7,169 @@ Purpose:
 """
 
 # IMPORT: utils
+import os
+import math
 import zstd
-
-# IMPORT: data loading
-import pydicom
+import hashlib
+import resource
+import threading
+from collections import Counter
 
 # IMPORT: data processing
 import numpy as np
 import torch
 
-# IMPORT: data visualization
-import matplotlib.pyplot as plt
-from matplotlib.gridspec import GridSpec
+# CONSTANTS: the dicom fields read once per slice by the loaders
+DICOM_HEADER_FIELDS = (
+    "InstanceNumber", "RescaleSlope", "RescaleIntercept", "ImagePositionPatient",
+    "SliceThickness", "PixelSpacing", "PatientPosition", "SeriesInstanceUID", "Modality", "Rows", "Columns"
+)
+
+# COUNTERS: the full-volume copies made since the last reset, by origin
+_VOLUME_COPIES = Counter()
+_VOLUME_COPIES_LOCK = threading.Lock()
+
+
+def count_volume_copy(origin: str):
+    """
+    Records a full-volume copy.
+
+    Parameters:
+        - origin (str): the function making the copy.
+    """
+    with _VOLUME_COPIES_LOCK:
+        _VOLUME_COPIES[origin] += 1
+
 
+def get_volume_copies() -> dict:
+    """
+    Returns the full-volume copies made since the last reset.
 
-def numpy_to_tensor(volume):
+    Returns:
+        - (dict): the number of copies, by origin.
+    """
+    with _VOLUME_COPIES_LOCK:
+        return dict(_VOLUME_COPIES)
+
+
+def reset_volume_copies():
+    """
+    Forgets the recorded full-volume copies.
+    """
+    with _VOLUME_COPIES_LOCK:
+        _VOLUME_COPIES.clear()
+
+
+def get_rss() -> int:
+    """
+    Returns the process' current resident memory.
+
+    Returns:
+        - (int): the resident memory in bytes, the peak one where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm_file:
+            return int(statm_file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return get_peak_rss()
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the process' peak resident memory, on Linux only.
+
+    Returns:
+        - (bool): whether the peak was reset, otherwise it stays the process' lifetime peak.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs_file:
+            clear_refs_file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss() -> int:
+    """
+    Returns the process' peak resident memory since the last reset_peak_rss.
+
+    Returns:
+        - (int): the peak resident memory in bytes, the process' lifetime peak where /proc is not available.
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def numpy_to_tensor(volume, copy: bool = True):
     """
     Converts numpy volume into a tensor.
 
     Parameters:
         - volume (numpy.ndarray): the numpy volume.
+        - copy (bool): whether to copy the volume; if False, the tensor shares its buffer when the dtype is float32,
+          the buffer writeable and the strides positive, otherwise a single copy also converts and reorients it.
 
     Returns:
         - (torch.Tensor): the volume as a tensor.
     """
-    return torch.from_numpy(volume.copy()).type(torch.float32)
+    if not copy and volume.dtype == np.float32 and volume.flags.writeable and min(volume.strides, default=0) >= 0:
+        return torch.from_numpy(volume)
+
+    count_volume_copy("numpy_to_tensor")
+    return torch.from_numpy(np.array(volume, dtype=np.float32))
+
+
+def allocate_tensor(shape: tuple, shared: bool = False) -> torch.Tensor:
+    """
+    Allocates a zero-filled float32 tensor, directly in shared memory if needed.
+
+    Parameters:
+        - shape (tuple): the tensor's shape.
+        - shared (bool): whether the tensor is shared with other processes; share_memory_ would copy a private
+          tensor's whole storage, the shared one is allocated in place.
+
+    Returns:
+        - (torch.Tensor): the zero-filled tensor.
+    """
+    if not shared:
+        return torch.zeros(shape)
+
+    # A new shared memory segment is zero-filled by the system
+    tensor = torch.empty(0, dtype=torch.float32)
+    storage = torch.UntypedStorage._new_shared(math.prod(shape) * tensor.element_size())
+    strides = tuple(math.prod(shape[axis + 1:]) for axis in range(len(shape)))
+    return tensor.set_(storage, 0, tuple(shape), strides)
+
+
+def hash_files(files_path: list, chunk_size: int = 2 ** 20) -> str:
+    """
+    Returns files' content hash.
+
+    Parameters:
+        - files_path (list): the files' paths.
+        - chunk_size (int): the number of bytes read at once.
+
+    Returns:
+        - (str): the sha256 hex digest of the files' content.
+    """
+    digest = hashlib.sha256()
+    for file_path in files_path:
+        with open(file_path, "rb") as file:
+            while chunk := file.read(chunk_size):
+                digest.update(chunk)
+
+    return digest.hexdigest()
 
 
 def load_numpy_compressed(path: str):
     """
-    Loads numpy compressed file.
+    Loads numpy compressed file, saved by save_numpy_compressed; nothing is unpickled.
 
     Parameters:
         - path (str): the file's path.
@@ -44,14 +177,34 @@ def load_numpy_compressed(path: str):
     Returns:
         - (torch.Tensor): the numpy file content as a tensor.
     """
-    volume = np.load(path, allow_pickle=True)
-    header = volume["header"][()]
+    with np.load(path, allow_pickle=False) as archive:
+        shape = tuple(int(size) for size in archive["shape"])
+        dtype = np.dtype(str(archive["dtype"]))
+        volume = zstd.decompress(archive["data"].tobytes())
+
+    volume = np.frombuffer(volume, dtype=dtype)
+    volume = np.reshape(volume, shape)
+
+    # The decompressed bytes are read-only, a single copy makes them writeable and converts them
+    count_volume_copy("load_numpy_compressed")
+    return torch.from_numpy(volume.astype(np.float32))
+
+
+def save_numpy_compressed(path: str, volume: np.ndarray):
+    """
+    Saves numpy compressed file, readable with load_numpy_compressed.
 
-    volume = zstd.decompress(volume["data"])
-    volume = np.frombuffer(volume, dtype=np.float32).copy()
-    volume = np.reshape(volume, header["shape"])
+    Parameters:
+        - path (str): the file's path.
+        - volume (np.ndarray): the volume to save.
+    """
+    volume = np.ascontiguousarray(volume)
 
-    return torch.from_numpy(volume).type(torch.float32)
+    # The shape and the dtype are plain arrays, the archive is read without pickle
+    np.savez(
+        path, shape=np.array(volume.shape, dtype=np.int64), dtype=np.array(volume.dtype.str),
+        data=np.frombuffer(zstd.compress(volume.tobytes()), dtype=np.uint8)
+    )
 
 
 def load_numpy(path: str):
@@ -81,6 +234,10 @@ def load_tensor(path: str):
 
 
 def plot_volume(volume):
+    # IMPORT: data visualization, only needed for debugging
+    import matplotlib.pyplot as plt
+    from matplotlib.gridspec import GridSpec
+
     if len(volume.shape) == 4:
         volume = volume[0]
 
@@ -111,7 +268,43 @@ def get_dicom_field(file_path: str, field: str):
     Returns:
         - (): the dicom field's value.
     """
-    return pydicom.read_file(file_path).get(field)
+    import pydicom
+
+    return pydicom.read_file(file_path, stop_before_pixels=True).get(field)
+
+
+def get_dicom_header(dicom_file) -> dict:
+    """
+    Returns the dicom fields needed by the pipeline.
+
+    Parameters:
+        - dicom_file (pydicom.Dataset): the dicom file.
+
+    Returns:
+        - (dict): the dicom fields' values as python values, indexed by field.
+    """
+    return {field: to_python_value(dicom_file.get(field)) for field in DICOM_HEADER_FIELDS}
+
+
+def to_python_value(value):
+    """
+    Converts a dicom value into python values, so headers can be pickled cheaply or stored as JSON.
+
+    Parameters:
+        - value (): the dicom value (DSfloat, IS, UID, MultiValue...).
+
+    Returns:
+        - (): the value as None, int, float, str or a list of them.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return [to_python_value(v) for v in value]
 
 
 def get_dicom_spacing(f_file_path: str, s_file_path: str):
@@ -125,9 +318,25 @@ def get_dicom_spacing(f_file_path: str, s_file_path: str):
     Returns:
         - (): the dicom field's value.
     """
-    first = pydicom.read_file(f_file_path)
-    second = pydicom.read_file(s_file_path)
+    import pydicom
 
+    return get_header_spacing(
+        pydicom.read_file(f_file_path, stop_before_pixels=True),
+        pydicom.read_file(s_file_path, stop_before_pixels=True)
+    )
+
+
+def get_header_spacing(first, second):
+    """
+    Returns dicom volume's spacing from two slices' headers.
+
+    Parameters:
+        - first (pydicom.Dataset | dict): the first slice's header.
+        - second (pydicom.Dataset | dict): the second slice's header.
+
+    Returns:
+        - (tuple): the volume's spacing.
+    """
     f_spacing = first.get("ImagePositionPatient")
     s_spacing = second.get("ImagePositionPatient")
 